@@ -1,13 +1,24 @@
 from formulas import ATLFormula
 from sample import SampleCGS
 from operators import *
-from pysmt.shortcuts import Symbol, And, Or, Implies, Solver, Not, ExactlyOne, Bool, Iff
+from cnf_solver import CNFSolver
+from parallel_encoding import parallel_semantics
+from cardinality import exactly_one, at_most_one, at_most
+from pysmt.shortcuts import Symbol, And, Or, Implies, Solver, Not, Bool, Iff
 
 class ATLSATEncoding:
 	
-	def __init__(self, sample, propositions, operators, solver_name, turn_based):
+	def __init__(self, sample, propositions, operators, solver_name, turn_based, child_mux=False, temporal_encoding='unroll', backend='pysmt',\
+			  symmetry_breaking=[], incremental='assume', active_examples=None,\
+			  workers=1, shared_states=False, leaf_constants=False, cardinality='pairwise',\
+			  child_index='onehot', semantic_uniqueness=False,\
+			  optimise=False, noise_budget=None, noise_solver='cardinality', lazy_depth=None,\
+			  template=None, labellings=None):
 		
-		self.solver = Solver(name=solver_name)
+		if backend == 'cnf':
+			self.solver = CNFSolver(solver_name)
+		else:
+			self.solver = Solver(name=solver_name)
 		self.sample = sample
 		self.propositions = propositions
 		self.operators = operators
@@ -22,41 +33,157 @@ class ATLSATEncoding:
 		self.x = {}
 		self.r = {}
 		self.l = {}
+		self.lb = {}
+		self.rb = {}
 		self.y = {}
 		self.aux_y = {}
 		self.A = {}
+		self.yl = {}
+		self.yr = {}
+		self.rank = {}
+		self.aux_z = {}
+
+		# child multiplexing: operand values are selected once per row instead of
+		# restating the operator semantics for every (left, right) child choice
+		self.child_mux = child_mux
+
+		# temporal operators are either unrolled layer by layer (aux_y) or encoded with a
+		# binary ranking of the states that has to strictly decrease along justifying successors
+		self.temporal_encoding = temporal_encoding
+
+		# the structures the semantic variables are stated over and, for every example, its initial
+		# states as (structure id, state) pairs; with shared_states the structures are the components
+		# of the union of all examples in which bisimilar states, also of different examples, are
+		# identified (see Sample.shared_structures), so that equivalent states share their variables
+		if shared_states:
+			self.structures, self.init_states = self.sample.shared_structures()
+		else:
+			self.structures = self.sample.positive + self.sample.negative
+			self.init_states = [[(cgs_id, state) for state in sorted(cgs.init_states)] for cgs_id, cgs in enumerate(self.structures)]
+
+		# number of unrolled layers per structure, after which the fixpoints are known to have converged
+		self.depth = {cgs_id: cgs.fixpoint_bound() for cgs_id, cgs in enumerate(self.structures)}
+
+		# with lazy_depth the fixpoints are unrolled to at most unroll[id] layers, starting from lazy_depth and
+		# deepened on the structures where a candidate relied on layers that had not converged (see refineDepth);
+		# the truncated unrolling only bounds the fixpoints (see truncatedFixpoint), so unsatisfiability is exact
+		self.lazy_depth = lazy_depth
+		if self.lazy_depth != None and (self.lazy_depth < 1 or self.temporal_encoding == 'rank'):
+			raise Exception('The lazy unrolling needs an initial depth of at least 1 and the unroll encoding')
+		self.unroll = {cgs_id: self.depth[cgs_id] if lazy_depth is None else min(lazy_depth, self.depth[cgs_id])\
+						for cgs_id in self.depth}
+		self.converged = {}
+
+		# symmetry breaking rules (see symmetryBreaking)
+		self.symmetry_breaking = symmetry_breaking
+
+		# the size-specific consistency constraints are either scoped with push/pop or guarded by an
+		# activation literal act[k] that is assumed when solving for size k, which keeps the solver
+		# (and the clauses it learnt about the rows shared by all sizes) alive across sizes
+		self.incremental = incremental
+		self.act = {}
+
+		# ids of the examples (positives first, then negatives) the encoding is stated over;
+		# further examples can be added later on with addExamples
+		self.active = set(range(self.sample.num_total)) if active_examples is None else set(active_examples)
+
+		# leaf rows get no semantic constraints: wherever their values are used, the value at a state
+		# is the disjunction of the selectors of the propositions holding there (see rowValue)
+		self.leaf_constants = leaf_constants
+
+		# number of processes building the semantic constraints of the structures (see parallel_encoding)
+		self.workers = workers
+		# (pid, pool) of the workers, forked on first use (see parallel_encoding)
+		self.worker_pool = None
+
+		# encoding of the one-hot groups x, l and r of every row (see cardinality)
+		self.cardinality = cardinality
+
+		# with child_index='binary', the index of each child of row i is also given by ceil(log2 i) bits
+		# (lb, rb) and l/r are decoders of these bits, which makes them at most one true per row
+		self.child_index = child_index
+
+		# every row must differ from the earlier rows at some state of the (reduced) structures
+		self.semantic_uniqueness = semantic_uniqueness
+
+		# all sizes are encoded at once and kept switchable: any size whose activation literal is set must
+		# be consistent, its rows are used (u) and the syntactic constraints only bind the used rows
+		self.optimise = optimise
+		if self.optimise and self.incremental != 'assume':
+			raise Exception('The optimisation mode requires assumption-based incremental solving')
+		self.used = {}
+
+		# with a noise budget every example may be sacrificed (e): its consistency constraints are relaxed,
+		# and at most noise_budget examples are, unless a MaxSAT solver minimises them (see softLiterals)
+		self.noise_budget = noise_budget
+		self.sacrificed = {}
+		if self.noise_budget != None:
+			self.sacrificed = {example_id: Symbol('e_%d'%example_id) for example_id in range(self.sample.num_total)}
+			if noise_solver == 'cardinality':
+				self.solver.add_assertion(at_most([self.sacrificed[example_id] for example_id in sorted(self.sacrificed)], self.noise_budget, 'noise'))
+
+		# with a template, a formula with holes (?), the template nodes are rows t0, t1, ... fixed once and
+		# for all, and rows 0..formula_size-1 only make up the subformulas filling the holes: every hole
+		# selects one of these rows (h) and carries its values (yh)
+		self.template_rows = []
+		self.holes = []
+		self.h = {}
+		self.yh = {}
+		if template != None:
+			self.templateRows(template)
+
+		# with labellings, lists of (positive ids, negative ids) over the structures of the sample, the
+		# consistency constraints of every labelling are switched by its own literal lab[k] (see classes),
+		# so that the formulas of all labellings are searched over the same rows and structures
+		self.labellings = labellings
+		self.label_act = {}
+		if self.labellings != None:
+			self.label_act = {label: Symbol('lab_%d'%label) for label in range(len(self.labellings))}
+
+		# encoding statistics (reported in the metadata)
+		self.stats = {'Fixpoint Constraints': 0, 'Fixpoint Constraints Saved (Estimate)': 0,
+					'Unrolling Depth': sum(self.depth.values()),
+					'Unrolling Depth Saved': sum(cgs.size + 1 - self.depth[cgs_id] for cgs_id, cgs in enumerate(self.structures))}
+		if self.lazy_depth != None:
+			self.stats['Depth Refinements'] = 0
 
 	"""
 	the working variables are 
 		- x[i][o]: i is a subformula (row) identifier, o is an operator or a propositional variable. Meaning is "subformula i is an operator (variable) o"
 		- l[i][j]:  "left operand of subformula i is subformula j"
 		- r[i][j]: "right operand of subformula i is subformula j"
+		- lb[i][b], rb[i][b]: bit b of the index of the left (right) operand of subformula i (binary child index only)
+		- u[i]: subformula i is used, i.e. not above the root (optimisation mode only)
+		- e[k]: example k is sacrificed, i.e. may be misclassified (noise budget only)
 		- y[i][tr][t]: semantics of formula i at state s of cgs M
+		- yl[i][tr][t], yr[i][tr][t]: semantics of the left (right) operand of formula i at state s of cgs M (child_mux only)
+		- rank[i][tr][t][b]: bit b of the rank of state s of cgs M in the fixpoint of formula i (ranking encoding only)
+		- aux_z[i][tr][t]: the dual least fixpoint of a greatest fixpoint of formula i at state s of cgs M (ranking encoding only)
+		- cv[i][tr][d]: the last two of the d unrolled layers of formula i agree on cgs M (lazy unrolling only)
+		- h[t][p][j]: operand p of template row t is a hole filled with subformula j (template only)
+		- yh[t][p][tr][s]: semantics of the hole filling operand p of template row t at state s of cgs M (template only)
+		- lab[k]: the consistency constraints of labelling k are enforced (labellings only)
 	"""
 	def encodeFormula(self, formula_size):
 		
 		#print('Preparing encoding for size %d'%formula_size)
 
-		self.x.update({ (formula_size - 1, o) : Symbol('x_%d_%s'%(formula_size-1,o)) for o in self.operators_and_propositions})
-
-		self.l.update({(formula_size - 1, childOperator) : Symbol('l_%d_%d'%(formula_size - 1,childOperator))\
-												 for childOperator in range(formula_size-1)})
-		
-		self.r.update({(formula_size - 1, childOperator) : Symbol('r_%d_%d'%(formula_size - 1,childOperator))\
-												 for childOperator in range(formula_size-1)})
-
-		self.A.update({(formula_size - 1, player): Symbol('A_%d_%d'%(formula_size - 1, player)) for player in self.sample.players})
+		self.rowVariables(formula_size)
 
-		self.y.update({ (formula_size - 1, cgs_id, state): Symbol('y_%d_%d_%d'%(formula_size - 1,cgs_id,state))
-						for cgs_id, cgs in enumerate(self.sample.positive + self.sample.negative) for state in cgs.states})
-		
-		self.aux_y.update({(formula_size - 1, cgs_id, state, dist): Symbol('y_%d_%d_%d_%d'%(formula_size - 1,cgs_id,state,dist))
-						for cgs_id, cgs in enumerate(self.sample.positive + self.sample.negative) for state in cgs.states
-						for dist in range(cgs.size+1)})
+		structures = self.activeStructures()
+		self.structureVariables(formula_size, structures)
 
-		if formula_size > 1:
-			self.solver.pop()
-			self.solver.pop()
+		if self.optimise:
+			self.used[formula_size - 1] = Symbol('u_%d'%(formula_size - 1))
+			if formula_size > 1:
+				self.solver.add_assertion(Implies(self.used[formula_size - 1], self.used[formula_size - 2]))
+		elif formula_size > 1:
+			if self.incremental == 'assume':
+				# the consistency constraints of the previous size are switched off for good
+				self.solver.add_assertion(Not(self.act[formula_size - 1]))
+			else:
+				self.solver.pop()
+				self.solver.pop()
 
 		#if formula_size == 3:
 		#	self.solver.add_assertion(And([self.x[(2, '&')], self.x[(1, 'p')], self.x[(0, 'q')], self.l[(2, 1)], self.r[(2, 0)]]))
@@ -65,32 +192,251 @@ class ATLSATEncoding:
 		# Structural Constraints
 		self.exactlyOneOperator(formula_size)
 		self.firstOperatorProposition(formula_size)
+		self.symmetryBreaking(formula_size)
 		#self.noDanglingNodes(formula_size)
+		for row, pos in self.holes:
+			self.solver.add_assertion(And([Not(And(self.h[(row, pos, formula_size - 1)], self.h[(row, pos, j)])) for j in range(formula_size - 1)]))
 		
 		# Semantic Constraints
-		self.propositionsSemantics(formula_size)
-		self.operatorsSemantics(formula_size) #<---
-		self.solver.push()
+		self.structureSemantics(formula_size, structures) #<---
+		if self.semantic_uniqueness:
+			self.distinctRows(formula_size, structures)
+		if self.template_rows:
+			self.templateSemantics(formula_size, structures)
+		if self.incremental != 'assume':
+			self.solver.push()
 
 		# Consistency Constraints
-		self.consistency(formula_size)
-		self.solver.push()
+		self.act[formula_size] = Symbol('act_%d'%formula_size)
+		self.consistency(formula_size, sorted(self.active))
+		if self.holes:
+			self.solver.add_assertion(self.guard(formula_size, And([Or([self.h[(row, pos, j)] for j in range(formula_size)]) for row, pos in self.holes])))
+		if self.optimise:
+			self.solver.add_assertion(Implies(self.act[formula_size], self.used[formula_size - 1]))
+		if self.incremental != 'assume':
+			self.solver.push()
 		
 		#self.solver.minimize(self.fr[formula_size-1])
 
-	def consistency(self, formula_size):
-		for cgs_id, cgs in enumerate(self.sample.positive + self.sample.negative):
-			if cgs_id < self.sample.num_positive:
-				self.solver.add_assertion(Or([self.y[(formula_size - 1, cgs_id, state)] for state in cgs.init_states]))
-			else:
-				self.solver.add_assertion(And([Not(self.y[(formula_size - 1, cgs_id, state)]) for state in cgs.init_states]))
+	def rowVariables(self, formula_size):
+		'''Operator and child selector variables of the last row'''
+		self.x.update({ (formula_size - 1, o) : Symbol('x_%d_%s'%(formula_size-1,o)) for o in self.operators_and_propositions})
+
+		self.l.update({(formula_size - 1, childOperator) : Symbol('l_%d_%d'%(formula_size - 1,childOperator))\
+												 for childOperator in range(formula_size-1)})
+		
+		self.r.update({(formula_size - 1, childOperator) : Symbol('r_%d_%d'%(formula_size - 1,childOperator))\
+												 for childOperator in range(formula_size-1)})
 
-	def propositionsSemantics(self, formula_size):
+		self.h.update({(row, pos, formula_size - 1): Symbol('h_%s_%d_%d'%(row, pos, formula_size - 1)) for row, pos in self.holes})
+
+		if self.child_index == 'binary':
+			self.lb.update({(formula_size - 1, bit): Symbol('lb_%d_%d'%(formula_size - 1, bit)) for bit in range(self.childIndexBits(formula_size - 1))})
+			self.rb.update({(formula_size - 1, bit): Symbol('rb_%d_%d'%(formula_size - 1, bit)) for bit in range(self.childIndexBits(formula_size - 1))})
+
+		self.A.update({(formula_size - 1, player): Symbol('A_%d_%d'%(formula_size - 1, player)) for player in self.sample.players})
+
+	def activeStructures(self, structure_ids=None):
+		'''(id, structure) pairs of the given structures, by default of the structures of the active examples'''
+		if structure_ids is None:
+			structure_ids = set(cgs_id for example_id in self.active for cgs_id, _ in self.init_states[example_id])
+		return [(cgs_id, self.structures[cgs_id]) for cgs_id in sorted(structure_ids)]
+
+	def structureVariables(self, formula_size, structures):
+		'''Semantic variables of the last row on the given structures'''
+		self.y.update({ (formula_size - 1, cgs_id, state): Symbol('y_%d_%d_%d'%(formula_size - 1,cgs_id,state))
+						for cgs_id, cgs in structures for state in cgs.states})
+		
+		if self.temporal_encoding == 'rank':
+			self.rank.update({(formula_size - 1, cgs_id, state, bit): Symbol('rk_%d_%d_%d_%d'%(formula_size - 1,cgs_id,state,bit))
+							for cgs_id, cgs in structures for state in cgs.states
+							for bit in range(self.rankBits(cgs_id))})
+			self.aux_z.update({(formula_size - 1, cgs_id, state): Symbol('z_%d_%d_%d'%(formula_size - 1,cgs_id,state))
+							for cgs_id, cgs in structures for state in cgs.states})
+		else:
+			self.aux_y.update({(formula_size - 1, cgs_id, state, dist): Symbol('y_%d_%d_%d_%d'%(formula_size - 1,cgs_id,state,dist))
+							for cgs_id, cgs in structures for state in cgs.states
+							for dist in range(self.unroll[cgs_id]+1)})
+
+		if self.child_mux:
+			self.yl.update({ (formula_size - 1, cgs_id, state): Symbol('yl_%d_%d_%d'%(formula_size - 1,cgs_id,state))
+							for cgs_id, cgs in structures for state in cgs.states})
+			self.yr.update({ (formula_size - 1, cgs_id, state): Symbol('yr_%d_%d_%d'%(formula_size - 1,cgs_id,state))
+							for cgs_id, cgs in structures for state in cgs.states})
+
+		if formula_size == 1 and self.template_rows:
+			self.templateVariables(structures)
+
+	def addExamples(self, example_ids, formula_size):
+		'''
+		States rows 0..formula_size-1 over the structures of further examples, and the consistency
+		constraint of the current size; the encoding is not scoped per size then, so this needs
+		assumption-based solving
+		'''
+		if self.incremental != 'assume':
+			raise Exception('Adding examples requires assumption-based incremental solving')
+		if self.semantic_uniqueness:
+			raise Exception('Rows stated distinct on the encoded structures may not be on further ones')
+		example_ids = [example_id for example_id in example_ids if example_id not in self.active]
+		encoded = set(cgs_id for cgs_id, _ in self.activeStructures())
+		self.active.update(example_ids)
+		structures = [(cgs_id, cgs) for cgs_id, cgs in self.activeStructures() if cgs_id not in encoded]
+		for size in range(1, formula_size+1):
+			self.structureVariables(size, structures)
+			self.structureSemantics(size, structures)
+			if self.template_rows:
+				self.templateSemantics(size, structures)
+		self.consistency(formula_size, example_ids)
+
+	def structureSemantics(self, formula_size, structures):
+		'''Semantics of the last row on the given structures, built in parallel if several workers are set'''
+		if self.workers > 1 and len(structures) > 1:
+			parallel_semantics(self, formula_size, structures, self.workers)
+		else:
+			self.propositionsSemantics(formula_size, structures)
+			self.operatorsSemantics(formula_size, structures)
+
+	def distinctRows(self, formula_size, structures):
+		'''
+		Row formula_size-1 differs from every earlier row at some state: the references to a row with
+		the same values as an earlier one could go to the earlier row, so a formula of minimal size
+		has no such row
+		'''
+		i = formula_size - 1
+		if structures == []:
+			return
+		for j in range(i):
+			self.solver.add_assertion(self.usedRow(i, Or([Not(Iff(self.rowValue(i, cgs_id, state), self.rowValue(j, cgs_id, state)))\
+										for cgs_id, cgs in structures for state in cgs.states])))
+
+	def templateRows(self, node):
+		'''
+		Adds the rows of a template node after those of its operands; returns its row id, or None for a hole.
+		The coalition of a temporal node is fixed, unless it is a hole itself (<?>)
+		'''
+		if node.label == '?':
+			return None
+		children = [self.templateRows(child) for child in [node.left, node.right] if child is not None]
+		row = 't%d'%len(self.template_rows)
+		op = node.label[-1] if node.label not in atl_boolean and node.label[-1] in atl_temporal else node.label
+		if op in atl_temporal:
+			self.A.update({(row, player): Symbol('A_%s_%d'%(row, player)) for player in self.sample.players})
+			if node.players != None:
+				self.solver.add_assertion(And([self.A[(row, player)] if player in node.players else Not(self.A[(row, player)])\
+												for player in self.sample.players]))
+		self.template_rows.append((row, op, children))
+		self.holes += [(row, pos) for pos, child in enumerate(children) if child is None]
+		return row
+
+	def templateVariables(self, structures):
+		'''Semantic variables of the template rows and of the holes on the given structures'''
+		self.y.update({(row, cgs_id, state): Symbol('y_%s_%d_%d'%(row, cgs_id, state))
+						for row, _, _ in self.template_rows for cgs_id, cgs in structures for state in cgs.states})
+		if self.temporal_encoding == 'rank':
+			self.rank.update({(row, cgs_id, state, bit): Symbol('rk_%s_%d_%d_%d'%(row, cgs_id, state, bit))
+							for row, op, _ in self.template_rows if op in atl_fixpoints
+							for cgs_id, cgs in structures for state in cgs.states for bit in range(self.rankBits(cgs_id))})
+			self.aux_z.update({(row, cgs_id, state): Symbol('z_%s_%d_%d'%(row, cgs_id, state))
+							for row, op, _ in self.template_rows if op in atl_fixpoints
+							for cgs_id, cgs in structures for state in cgs.states})
+		else:
+			self.aux_y.update({(row, cgs_id, state, dist): Symbol('y_%s_%d_%d_%d'%(row, cgs_id, state, dist))
+							for row, op, _ in self.template_rows if op in atl_fixpoints
+							for cgs_id, cgs in structures for state in cgs.states for dist in range(self.unroll[cgs_id]+1)})
+		self.yh.update({(row, pos, cgs_id, state): Symbol('yh_%s_%d_%d_%d'%(row, pos, cgs_id, state))
+						for row, pos in self.holes for cgs_id, cgs in structures for state in cgs.states})
+
+	def templateSemantics(self, formula_size, structures):
+		'''
+		Semantics of the template rows on the given structures, stated along with the first row, and of
+		the holes being filled with row formula_size-1
+		'''
+		j = formula_size - 1
+		for cgs_id, cgs in structures:
+			if j == 0:
+				for row, op, children in self.template_rows:
+					if children == []:
+						self.solver.add_assertion(And([Iff(self.y[(row, cgs_id, state)], Bool(op in cgs.labels[state]))\
+													for state in cgs.states]))
+						continue
+					operands = [{state: self.y[(child, cgs_id, state)] if child != None else self.yh[(row, pos, cgs_id, state)]\
+									for state in cgs.states} for pos, child in enumerate(children)]
+					self.solver.add_assertion(self.operatorSemantics(op, row, operands[0], operands[1] if len(operands) > 1 else None,\
+																	cgs_id, cgs))
+			for row, pos in self.holes:
+				self.solver.add_assertion(Implies(self.h[(row, pos, j)],\
+											And([Iff(self.yh[(row, pos, cgs_id, state)], self.rowValue(j, cgs_id, state))\
+												for state in cgs.states])))
+
+	def consistency(self, formula_size, example_ids):
+		for example_id in example_ids:
+			init_values = [self.rootValue(formula_size, cgs_id, state) for cgs_id, state in self.init_states[example_id]]
+			for label, positive in self.classes(example_id):
+				if positive:
+					constraint = Or(init_values)
+				else:
+					constraint = And([Not(value) for value in init_values])
+				if example_id in self.sacrificed:
+					constraint = Or(self.sacrificed[example_id], constraint)
+				if label != None:
+					constraint = Implies(self.label_act[label], constraint)
+				self.solver.add_assertion(self.guard(formula_size, constraint))
+
+	def classes(self, example_id):
+		'''
+		(labelling, whether positive) for the labellings classifying the example; without labellings
+		only the sample's own classification, as labelling None
+		'''
+		if self.labellings == None:
+			return [(None, example_id < self.sample.num_positive)]
+		return [(label, positive) for label, (positives, negatives) in enumerate(self.labellings)\
+				for positive, structure_ids in [(True, positives), (False, negatives)] if example_id in structure_ids]
+
+	def rootValue(self, formula_size, cgs_id, state):
+		'''The value of the formula at a state: of the template root if there is a template, of the last row otherwise'''
+		if self.template_rows:
+			return self.y[(self.template_rows[-1][0], cgs_id, state)]
+		return self.rowValue(formula_size - 1, cgs_id, state)
+
+	def guard(self, formula_size, constraint):
+		'''Makes a size-specific constraint conditional on the activation literal of the size'''
+		if self.incremental == 'assume':
+			return Implies(self.act[formula_size], constraint)
+		return constraint
+
+	def usedRow(self, i, constraint):
+		'''Makes a syntactic constraint on row i conditional on the row being used (optimisation mode)'''
+		if self.optimise:
+			return Implies(self.used[i], constraint)
+		return constraint
+
+	def boundSize(self, size_bound):
+		'''Optimisation mode: some size up to size_bound must be consistent, for good'''
+		self.solver.add_assertion(Or([self.act[size] for size in self.act if size <= size_bound]))
+
+	def modelSize(self, model):
+		'''Optimisation mode: the smallest size consistent in the model'''
+		return min(size for size in self.act if model[self.act[size]].is_true())
+
+	def softLiterals(self):
+		'''The examples of the encoding not being sacrificed, to be maximised by a MaxSAT solver'''
+		return [Not(self.sacrificed[example_id]) for example_id in sorted(self.active)]
+
+	def assumptions(self, formula_size, label=None):
+		'''Literals to solve the encoding of the given size under, for the given labelling if there are several'''
+		literals = [self.label_act[label]] if label != None else []
+		if self.incremental == 'assume':
+			return [self.act[formula_size]] + literals
+		return literals
+
+	def propositionsSemantics(self, formula_size, structures):
 
 		i = formula_size-1
+		if self.leaf_constants:
+			return
 
 		for p in self.propositions:
-			for cgs_id, cgs in enumerate(self.sample.positive + self.sample.negative):
+			for cgs_id, cgs in structures:
 				self.solver.add_assertion(Implies(self.x[(i, p)],\
 									And([Iff(self.y[(i, cgs_id, state)], Bool(p in cgs.labels[state]))\
 									for state in cgs.states\
@@ -101,7 +447,7 @@ class ATLSATEncoding:
 		
 		i = formula_size - 1
 		
-		self.solver.add_assertion(ExactlyOne([self.x[k] for k in self.x if k[0] == i]))
+		self.solver.add_assertion(exactly_one([self.x[k] for k in self.x if k[0] == i], self.cardinality, 'cx_%d'%i))
 		
 		self.solver.add_assertion(Implies(Or([self.x[(i, op)] for op in self.propositions]),\
 										And(Not(Or([self.l[k] for k in self.l if k[0] == i])),\
@@ -111,21 +457,78 @@ class ATLSATEncoding:
 
 		if i > 0:
 			
+			# at most one child of each side is selected even for leaves (which select none), only
+			# the at-least-one part depends on the operator
+			if self.child_index == 'binary':
+				self.solver.add_assertion(self.childDecoder(i, self.l, self.lb))
+				self.solver.add_assertion(self.childDecoder(i, self.r, self.rb))
+			else:
+				self.solver.add_assertion(at_most_one([self.l[k] for k in self.l if k[0]==i], self.cardinality, 'cl_%d'%i))
+				self.solver.add_assertion(at_most_one([self.r[k] for k in self.r if k[0]==i], self.cardinality, 'cr_%d'%i))
+
 			self.solver.add_assertion(Implies(Or([self.x[(i, op)] for op in self.operators]),\
-												ExactlyOne([self.l[k] for k in self.l if k[0]==i])))								  
+												Or([self.l[k] for k in self.l if k[0]==i])))
 
 			self.solver.add_assertion(Implies(Or([self.x[(i, op)] for op in self.binary_operators]),\
-												ExactlyOne([self.r[k] for k in self.r if k[0] == i])))
+												Or([self.r[k] for k in self.r if k[0] == i])))
 			
 			self.solver.add_assertion(Implies(Or([self.x[(i, op)] for op in self.unary_operators]),\
 										Not(Or([self.r[k] for k in self.r if k[0] == i]))))
 
 	
+	def childIndexBits(self, i):
+		return (i - 1).bit_length() if i > 0 else 0
+
+	def childDecoder(self, i, selectors, bits):
+		'''
+		Selecting child j of row i sets the index bits of row i to j; the bits taking a single value,
+		at most one child is selected
+		'''
+		return And([Implies(selectors[(i, j)], And([bits[(i, bit)] if (j >> bit) & 1 else Not(bits[(i, bit)])\
+													for bit in range(self.childIndexBits(i))])) for j in range(i)])
+
 	def firstOperatorProposition(self, formula_size):
 		i = formula_size - 1
 		if i == 0:
 			self.solver.add_assertion(Or([self.x[(0,prop)] for prop in self.propositions]))
 
+	def symmetryBreaking(self, formula_size):
+		'''
+		Optional constraints removing syntax DAGs that are isomorphic or equivalent to smaller ones;
+		none of them excludes every minimal DAG of a consistent formula:
+			- commutative: the left operand of & and | is a strictly smaller row than the right one
+			- leaves: the leaves occupy a prefix of the rows, in the order of self.propositions
+			- redundancy: no !!f, no <A>op(<A>op(f)) for idempotent op, and no <A>(f U f)
+		'''
+		i = formula_size - 1
+
+		if 'commutative' in self.symmetry_breaking:
+			for op in atl_commutative:
+				if op in self.binary_operators:
+					self.solver.add_assertion(self.usedRow(i, Implies(self.x[(i, op)],\
+												And([Implies(self.l[(i, left_arg)], Not(Or([self.r[(i, right_arg)] for right_arg in range(left_arg+1)])))\
+													for left_arg in range(i)]))))
+
+		if 'leaves' in self.symmetry_breaking and i > 0:
+			leaves = self.propositions
+			self.solver.add_assertion(self.usedRow(i, Implies(Or([self.x[(i, p)] for p in leaves]), Or([self.x[(i-1, p)] for p in leaves]))))
+			for pos, p in enumerate(leaves):
+				self.solver.add_assertion(self.usedRow(i, Implies(self.x[(i, p)], Not(Or([self.x[(i-1, q)] for q in leaves[pos:]])))))
+
+		if 'redundancy' in self.symmetry_breaking:
+			if '!' in self.operators:
+				self.solver.add_assertion(self.usedRow(i, Implies(self.x[(i, '!')],\
+											And([Implies(self.l[(i, child)], Not(self.x[(child, '!')])) for child in range(i)]))))
+			for op in atl_idempotent:
+				if op in self.operators:
+					self.solver.add_assertion(self.usedRow(i, Implies(self.x[(i, op)],\
+												And([Implies(And(self.l[(i, child)], self.x[(child, op)]),\
+															Not(And([Iff(self.A[(i, player)], self.A[(child, player)]) for player in self.sample.players])))\
+													for child in range(i)]))))
+			if 'U' in self.operators:
+				self.solver.add_assertion(self.usedRow(i, Implies(self.x[(i, 'U')],\
+											And([Implies(self.l[(i, child)], Not(self.r[(i, child)])) for child in range(i)]))))
+
 	def noDanglingNodes(self, formula_size):
 		i = formula_size - 1
 		self.solver.add_assertion(
@@ -138,151 +541,141 @@ class ATLSATEncoding:
 			)
 		)
 
-	def operatorsSemantics(self, formula_size):
+	def operatorsSemantics(self, formula_size, structures, operators=None):
+		'''Semantics of the last row on the given structures, for all operators or only the given ones'''
 		
 		i = formula_size-1
-
-		for cgs_id, cgs in enumerate(self.sample.positive + self.sample.negative):
-			
-			if '!' in self.operators:
-				#negation
-				self.solver.add_assertion(Implies(self.x[(i, '!')],\
+		restated = operators != None
+		operators = self.operators if operators is None else operators
+
+		for cgs_id, cgs in structures:
+
+			if self.child_mux:
+				#operator semantics stated once over the selected child values
+				if i == 0:
+					continue
+				if not restated:
+					self.childMultiplexer(i, cgs_id, cgs)
+				left = {state: self.yl[(i, cgs_id, state)] for state in cgs.states}
+				right = {state: self.yr[(i, cgs_id, state)] for state in cgs.states} if self.binary_operators else None
+				for op in operators:
+					self.solver.add_assertion(Implies(self.x[(i, op)], self.operatorSemantics(op, i, left, right, cgs_id, cgs)))
+				continue
+
+			for op in [op for op in self.unary_operators if op in operators]:
+				self.solver.add_assertion(Implies(self.x[(i, op)],\
 													And([\
 														Implies(\
 																	self.l[(i,only_arg)],\
-																	And([Iff(self.y[(i, cgs_id, state)],\
-																		Not(self.y[(only_arg, cgs_id, state)]))
-																	for state in cgs.states\
-																	])\
+																	self.operatorSemantics(op, i, self.rowValues(only_arg, cgs_id, cgs),\
+																							None, cgs_id, cgs)\
 																	)\
 														for only_arg in range(i)\
 														])\
 													))
 
-			
-			if '|' in self.operators:
-				#disjunction
-				self.solver.add_assertion(Implies(self.x[(i, '|')],\
-														And([ Implies(\
-																	   And(\
-																		   [self.l[i, left_arg], self.r[i, right_arg]]\
-																		   ),\
-																	   	And([Iff(self.y[(i, cgs_id, state)],
-																	   			Or(self.y[(left_arg, cgs_id, state)], self.y[(right_arg, cgs_id, state)]))
-																	   			for state in cgs.states\
-																			])\
-																	   )\
-																	  for left_arg in range(i) for right_arg in range(i) ])))
-
-			
-
-			
-			if '&' in self.operators:
-				#conjunction
-				self.solver.add_assertion(Implies(self.x[(i, '&')],\
-														And([ Implies(\
-																	   And(\
-																		   [self.l[i, left_arg], self.r[i, right_arg]]\
-																		   ),\
-																	   	And([Iff(self.y[(i, cgs_id, state)],
-																	   			And(self.y[(left_arg, cgs_id, state)], self.y[(right_arg, cgs_id, state)]))
-																	   			for state in cgs.states\
-																			])\
-																	   )\
-																	  for left_arg in range(i) for right_arg in range(i) ])))
-				
-			if '->' in self.operators:
-				#implication
-				self.solver.add_assertion(Implies(self.x[(i, '->')],\
-														And([ Implies(\
-																	   And(\
-																		   [self.l[i, left_arg], self.r[i, right_arg]]\
-																		   ),\
-																	   	And([Iff(self.y[(i, cgs_id, state)],
-																	   			Implies(self.y[(left_arg, cgs_id, state)], self.y[(right_arg, cgs_id, state)]))
-																	   			for state in cgs.states\
-																			])\
-																	   )\
-																	  for left_arg in range(i) for right_arg in range(i) ])))
-				
-			if 'X' in self.operators:
-				#X
-				self.solver.add_assertion(Implies(self.x[(i, 'X')],\
-													And([\
-														Implies(\
-																	self.l[(i,only_arg)],\
-																	And([Iff(self.y[(i, cgs_id, state)],\
-																		self.preConstraint(i, only_arg, cgs, cgs_id, state))
-																	for state in cgs.states\
-																	])\
-																	)\
-														for only_arg in range(i)\
-														])\
-													))
-			
-			if 'F' in self.operators:
-				#F
-				self.solver.add_assertion(Implies(self.x[(i, 'F')],\
-													And([\
-														Implies(\
-																	self.l[(i,only_arg)],\
-																	And([Iff(self.y[(i, cgs_id, state)],\
-																		self.aux_y[(i,cgs_id,state,cgs.size)])
-																	for state in cgs.states\
-																	]+[self.auxConstraintsF(i,only_arg)])\
-																	)\
-														for only_arg in range(i)\
-														])\
-													))
-			
-			if 'G' in self.operators:
-				#G
-				self.solver.add_assertion(Implies(self.x[(i, 'G')],\
-													And([\
-														Implies(\
-																	self.l[(i,only_arg)],\
-																	And([Iff(self.y[(i, cgs_id, state)],\
-																		self.aux_y[(i, cgs_id, state, cgs.size)])
-																	for state in cgs.states\
-																	]+[self.auxConstraintsG(i,only_arg)])\
-																	)\
-														for only_arg in range(i)\
-														])\
-													))
-			
-			
-			if 'U' in self.operators:
-				#U
-				self.solver.add_assertion(Implies(self.x[(i, 'U')],\
+			for op in [op for op in self.binary_operators if op in operators]:
+				self.solver.add_assertion(Implies(self.x[(i, op)],\
 													And([\
 														Implies(\
 																	And(self.l[(i,left_arg)], self.r[(i,right_arg)]),\
-																	And([Iff(self.y[(i, cgs_id, state)],\
-																		self.aux_y[(i,cgs_id,state,cgs.size)])
-																	for state in cgs.states\
-																	]+[self.auxConstraintsU(i,left_arg,right_arg)])\
+																	self.operatorSemantics(op, i, self.rowValues(left_arg, cgs_id, cgs),\
+																							self.rowValues(right_arg, cgs_id, cgs), cgs_id, cgs)\
 																	)\
 														for left_arg in range(i) for right_arg in range(i)\
 														])\
 													))
 
+	def rowValues(self, j, cgs_id, cgs):
+		'''
+		The semantics of row j on the given structure, as operand values for a parent row
+		'''
+		return {state: self.rowValue(j, cgs_id, state) for state in cgs.states}
+
+	def rowValue(self, j, cgs_id, state):
+		'''
+		The value of row j at a state: its semantic variable, or, with leaf_constants, the label of
+		the state if row j is a leaf (as row 0 always is)
+		'''
+		if not self.leaf_constants:
+			return self.y[(j, cgs_id, state)]
+		true_leaves = [self.x[(j, p)] for p in self.propositions if p in self.structures[cgs_id].labels[state]]
+		if j == 0:
+			return Or(true_leaves)
+		return Or(And(Or([self.x[(j, op)] for op in self.operators]), self.y[(j, cgs_id, state)]), Or(true_leaves))
+
+	def childMultiplexer(self, i, cgs_id, cgs):
+		'''
+		yl (resp. yr) carries the semantics of the row selected by l (resp. r), so that the
+		operator semantics of row i only need to be stated once instead of once per child choice
+		'''
+		for child in range(i):
+			self.solver.add_assertion(Implies(self.l[(i, child)],\
+										And([Iff(self.yl[(i, cgs_id, state)], self.rowValue(child, cgs_id, state))\
+											for state in cgs.states])))
+			if self.binary_operators:
+				self.solver.add_assertion(Implies(self.r[(i, child)],\
+										And([Iff(self.yr[(i, cgs_id, state)], self.rowValue(child, cgs_id, state))\
+											for state in cgs.states])))
+
+	def operatorSemantics(self, op, i, left, right, cgs_id, cgs):
+		'''
+		Semantics of row i being operator op on the given structure; left and right map every
+		state to the value of the respective operand
+		'''
+		if op == '!':
+			return And([Iff(self.y[(i, cgs_id, state)], Not(left[state])) for state in cgs.states])
+
+		if op == '|':
+			return And([Iff(self.y[(i, cgs_id, state)], Or(left[state], right[state])) for state in cgs.states])
+
+		if op == '&':
+			return And([Iff(self.y[(i, cgs_id, state)], And(left[state], right[state])) for state in cgs.states])
+
+		if op == '->':
+			return And([Iff(self.y[(i, cgs_id, state)], Implies(left[state], right[state])) for state in cgs.states])
+
+		if op == 'X':
+			return And([Iff(self.y[(i, cgs_id, state)], self.preConstraint(i, left, cgs, cgs_id, state))\
+						for state in cgs.states])
+
+		if self.temporal_encoding == 'rank':
+			return self.rankedSemantics(op, i, left, right, cgs_id, cgs)
+
+		# temporal operators: the value is the last layer of the unrolled fixpoint
+		depth = self.unroll[cgs_id]
+		if depth < self.depth[cgs_id]:
+			fixpoint = self.truncatedFixpoint(op, i, depth, cgs_id, cgs)
+		else:
+			fixpoint = And([Iff(self.y[(i, cgs_id, state)], self.aux_y[(i, cgs_id, state, depth)])\
+							for state in cgs.states])
+
+		if op == 'F':
+			return And(fixpoint, self.auxConstraintsF(i, left, cgs_id, cgs))
+
+		if op == 'G':
+			return And(fixpoint, self.auxConstraintsG(i, left, cgs_id, cgs))
 
-	def preConstraint(self, i, j, cgs, cgs_id, state):
+		if op == 'U':
+			return And(fixpoint, self.auxConstraintsU(i, left, right, cgs_id, cgs))
+
+
+	def preConstraint(self, i, left, cgs, cgs_id, state):
 
 		all_transitions = cgs.actions[state]
 		
 		if self.turn_based:
 			state_player = cgs.state_player[state]	
-			result = And(Implies(self.A[(i,state_player)],Or([self.y[(j, cgs_id, cgs.transitions[state][trans])] \
+			result = And(Implies(self.A[(i,state_player)],Or([left[cgs.transitions[state][trans]] \
 								for trans in all_transitions])),
-						Implies(Not(self.A[(i,state_player)]),And([self.y[(j, cgs_id, cgs.transitions[state][trans])] \
+						Implies(Not(self.A[(i,state_player)]),And([left[cgs.transitions[state][trans]] \
 								for trans in all_transitions])))	
 		else:
 			result = Or([\
 					And([ Implies( And([Implies(self.A[(i,player)],Bool(trans1[player]==trans2[player]))\
 											for player in cgs.players\
 										]),\
-				   			self.y[(j, cgs_id, cgs.transitions[state][trans2])]) \
+				   			left[cgs.transitions[state][trans2]]) \
 							for trans2 in all_transitions\
 						]) for trans1 in all_transitions\
 					])
@@ -310,49 +703,171 @@ class ATLSATEncoding:
 					])
 		return result
 
-	def auxConstraintsF(self, i, j):
+	def auxConstraintsF(self, i, left, cgs_id, cgs):
 		
-		aux_formula = Bool(True)
-		for cgs_id, cgs in enumerate(self.sample.positive + self.sample.negative):
-			for state in cgs.states:
-				aux_formula = And(aux_formula, Iff(self.aux_y[(i, cgs_id, state, 0)], self.y[(j, cgs_id, state)]))
-				aux_formula = And([aux_formula]+[Iff(\
-											self.aux_y[(i, cgs_id, state, dist+1)],\
-											Or(self.aux_y[(i, cgs_id, state, dist)],
-			   								self.preConstraintTemporal(i,cgs,cgs_id,state,dist))\
-											) for dist in range(cgs.size)])
-		return aux_formula
-
-	def auxConstraintsG(self, i, j):
-
-		aux_formula = Bool(True)
-		for cgs_id, cgs in enumerate(self.sample.positive + self.sample.negative):
-			for state in cgs.states:
-				aux_formula = And(aux_formula, Iff(self.aux_y[(i, cgs_id, state, 0)], self.y[(j, cgs_id, state)]))
-				aux_formula = And([aux_formula]+[Iff(\
-											self.aux_y[(i, cgs_id, state, dist+1)],\
-											And(self.y[(j, cgs_id, state)],
-			   								self.preConstraintTemporal(i, cgs, cgs_id, state, dist))\
-											) for dist in range(cgs.size)])
-		return aux_formula
-
-	def auxConstraintsU(self, i, j, k):
-
-		aux_formula = Bool(True)
-		for cgs_id, cgs in enumerate(self.sample.positive + self.sample.negative):
-			for state in cgs.states:
-				aux_formula = And(aux_formula, Iff(self.aux_y[(i, cgs_id, state, 0)], self.y[(k, cgs_id, state)]))
-				aux_formula = And([aux_formula]+[Iff(\
-											self.aux_y[(i, cgs_id, state, dist+1)],\
-											Or(self.aux_y[(i, cgs_id, state, dist)],
-			  								And(self.y[(j,cgs_id, state)],\
-			   								self.preConstraintTemporal(i, cgs, cgs_id, state, dist)))\
-											) for dist in range(cgs.size)])
-		return aux_formula
+		aux_formula = []
+		for state in cgs.states:
+			aux_formula.append(Iff(self.aux_y[(i, cgs_id, state, 0)], left[state]))
+			aux_formula += [Iff(\
+							self.aux_y[(i, cgs_id, state, dist+1)],\
+							Or(self.aux_y[(i, cgs_id, state, dist)],
+							self.preConstraintTemporal(i,cgs,cgs_id,state,dist))\
+							) for dist in range(self.unroll[cgs_id])]
+		self.countFixpointConstraints(len(aux_formula))
+		return And(aux_formula)
+
+	def auxConstraintsG(self, i, left, cgs_id, cgs):
+
+		aux_formula = []
+		for state in cgs.states:
+			aux_formula.append(Iff(self.aux_y[(i, cgs_id, state, 0)], left[state]))
+			aux_formula += [Iff(\
+							self.aux_y[(i, cgs_id, state, dist+1)],\
+							And(left[state],
+							self.preConstraintTemporal(i, cgs, cgs_id, state, dist))\
+							) for dist in range(self.unroll[cgs_id])]
+		self.countFixpointConstraints(len(aux_formula))
+		return And(aux_formula)
+
+	def auxConstraintsU(self, i, left, right, cgs_id, cgs):
+
+		aux_formula = []
+		for state in cgs.states:
+			aux_formula.append(Iff(self.aux_y[(i, cgs_id, state, 0)], right[state]))
+			aux_formula += [Iff(\
+							self.aux_y[(i, cgs_id, state, dist+1)],\
+							Or(self.aux_y[(i, cgs_id, state, dist)],
+							And(left[state],\
+							self.preConstraintTemporal(i, cgs, cgs_id, state, dist)))\
+							) for dist in range(self.unroll[cgs_id])]
+		self.countFixpointConstraints(len(aux_formula))
+		return And(aux_formula)
+
+	def rankedSemantics(self, op, i, left, right, cgs_id, cgs):
+		'''
+		Ranking encoding of the temporal operators: the least fixpoints F and U are encoded directly,
+		G through the least fixpoint of the dual equation (aux_z = !y), which does not rely on determinacy
+		'''
+		pre = lambda state, values: self.preConstraint(i, values, cgs, cgs_id, state)
+		dual_pre = lambda state, values: Not(self.preConstraint(i, {succ: Not(values[succ]) for succ in values}, cgs, cgs_id, state))
+		y = self.rowValues(i, cgs_id, cgs)
+		z = {state: self.aux_z[(i, cgs_id, state)] for state in cgs.states}
+		anywhere = {state: Bool(True) for state in cgs.states}
+
+		if op == 'F':
+			return self.rankedFixpoint(i, y, left, anywhere, pre, cgs_id, cgs)
+
+		if op == 'U':
+			return self.rankedFixpoint(i, y, right, left, pre, cgs_id, cgs)
+
+		if op == 'G':
+			negated = {state: Not(left[state]) for state in cgs.states}
+			return And(And([Iff(y[state], Not(z[state])) for state in cgs.states]),\
+						self.rankedFixpoint(i, z, negated, anywhere, dual_pre, cgs_id, cgs))
+
+	def rankedFixpoint(self, i, value, base, guard, pre, cgs_id, cgs):
+		'''
+		value is the least fixpoint of  X = base | (guard & pre(X)):
+			- it is closed under the equation (so it contains the least fixpoint), and
+			- every state in it is justified by base or by successors in it of strictly smaller rank
+			  (so it is contained in the least fixpoint)
+		'''
+		aux_formula = []
+		for state in cgs.states:
+			justified = {succ: And(value[succ], self.rankLess(i, cgs_id, succ, state)) for succ in cgs.successors(state)}
+			aux_formula.append(Implies(Or(base[state], And(guard[state], pre(state, value))), value[state]))
+			aux_formula.append(Implies(value[state], Or(base[state], And(guard[state], pre(state, justified)))))
+		self.countFixpointConstraints(len(aux_formula))
+		return And(aux_formula)
+
+	def rankLess(self, i, cgs_id, state1, state2):
+		'''rank of state1 < rank of state2 (comparing bits from least to most significant)'''
+		less = Bool(False)
+		for bit in range(self.rankBits(cgs_id)):
+			bit1 = self.rank[(i, cgs_id, state1, bit)]
+			bit2 = self.rank[(i, cgs_id, state2, bit)]
+			less = Or(And(Not(bit1), bit2), And(Iff(bit1, bit2), less))
+		return less
+
+	def rankBits(self, cgs_id):
+		'''ranks range over 0..depth, the number of iterations the fixpoints need on the structure'''
+		return max(1, self.depth[cgs_id].bit_length())
+
+	def truncatedFixpoint(self, op, i, depth, cgs_id, cgs):
+		'''
+		Row i of a temporal operator whose unrolling stops at layer depth before it is known to converge:
+		the layers of a least fixpoint grow towards it and those of a greatest fixpoint shrink towards it,
+		so the last layer bounds the value from below (resp. above), and it is the value if the last two
+		layers agree (cv)
+		'''
+		converged = Symbol('cv_%d_%d_%d'%(i, cgs_id, depth))
+		self.converged[(i, cgs_id, depth)] = converged
+		layer = lambda state, dist: self.aux_y[(i, cgs_id, state, dist)]
+		aux_formula = [Iff(converged, And([Iff(layer(state, depth-1), layer(state, depth)) for state in cgs.states]))]
+		for state in cgs.states:
+			if op in atl_greatest:
+				aux_formula.append(Implies(self.y[(i, cgs_id, state)], layer(state, depth)))
+			else:
+				aux_formula.append(Implies(layer(state, depth), self.y[(i, cgs_id, state)]))
+			aux_formula.append(Implies(converged, Iff(self.y[(i, cgs_id, state)], layer(state, depth))))
+		return And(aux_formula)
+
+	def unconvergedStructures(self, model, formula_size):
+		'''Structures on which a fixpoint row of the model is unrolled short of convergence and its last layers disagree'''
+		structure_ids = set()
+		for i in range(formula_size):
+			if any(op in atl_fixpoints and model[self.x[(i, op)]].is_true() for op in self.operators):
+				for cgs_id, _ in self.activeStructures():
+					depth = self.unroll[cgs_id]
+					if depth < self.depth[cgs_id] and not model[self.converged[(i, cgs_id, depth)]].is_true():
+						structure_ids.add(cgs_id)
+		return sorted(structure_ids)
+
+	def refineDepth(self, structure_ids, formula_size):
+		'''
+		Doubles the unrolling depth on the given structures and states the deeper layers of the temporal
+		rows 0..formula_size-1 on them; the constraints of the shallower unrolling stay sound and are kept
+		'''
+		for cgs_id in structure_ids:
+			self.unroll[cgs_id] = min(2*self.unroll[cgs_id], self.depth[cgs_id])
+		structures = self.activeStructures(structure_ids)
+		for size in range(1, formula_size+1):
+			self.structureVariables(size, structures)
+			self.operatorsSemantics(size, structures, [op for op in self.operators if op in atl_fixpoints])
+		self.stats['Depth Refinements'] += 1
+
+	def countFixpointConstraints(self, num_constraints):
+		'''
+		Counts the unrolled fixpoint definitions emitted; the saving is an estimate, not a
+		measurement, assuming each definition would otherwise be stated once per structure
+		'''
+		self.stats['Fixpoint Constraints'] += num_constraints
+		self.stats['Fixpoint Constraints Saved (Estimate)'] += num_constraints*(len(self.structures)-1)
+
+	def blockFormula(self, model, formula_size):
+		'''Excludes the choice of operators and children of rows 0..formula_size-1 made in the model'''
+		literals = [selectors[k] for selectors in [self.x, self.l, self.r] for k in selectors\
+					if k[0] < formula_size and model[selectors[k]].is_true()]
+		literals += [self.h[k] for k in self.h if k[2] < formula_size and model[self.h[k]].is_true()]
+		rows = list(range(formula_size)) + [row for row, _, _ in self.template_rows]
+		literals += [self.A[k] if model[self.A[k]].is_true() else Not(self.A[k]) for k in self.A if k[0] in rows]
+		self.solver.add_assertion(Not(And(literals)))
 
 	def reconstructWholeFormula(self, model, formula_size):
 
-		return self.reconstructFormula(model, formula_size-1)
+		if not self.template_rows:
+			return self.reconstructFormula(model, formula_size-1)
+
+		# the template with every hole filled with the formula of the row it selects
+		formulas = {}
+		for row, op, children in self.template_rows:
+			operands = [formulas[child] if child != None else\
+						self.reconstructFormula(model, [j for j in range(formula_size) if model[self.h[(row, pos, j)]].is_true()][0])\
+						for pos, child in enumerate(children)]
+			if op in atl_temporal:
+				op = '<'+''.join(str(player) for player in self.sample.players if model[self.A[(row, player)]].is_true())+'>'+op
+			formulas[row] = ATLFormula([op] + operands + [None]*(2 - len(operands)))
+		return formulas[self.template_rows[-1][0]]
 
 		
 	def reconstructFormula(self, model, rowId):
@@ -364,6 +879,11 @@ class ATLSATEncoding:
 				raise Exception("more than one true value")
 			else:
 				return tt
+
+		def getChild(row, vars, bits):
+			if self.child_index == 'binary':
+				return sum(1 << bit for bit in range(self.childIndexBits(row)) if model[bits[(row, bit)]].is_true())
+			return getValue(row, vars)[0]
 		
 		operator = getValue(rowId, self.x)[0]
 		
@@ -373,7 +893,7 @@ class ATLSATEncoding:
 		
 		elif operator in self.unary_operators:
 
-			left_child = getValue(rowId, self.l)[0]
+			left_child = getChild(rowId, self.l, self.lb)
 			left_formula = self.reconstructFormula(model, left_child)
 			
 			if operator in self.temporal_operators:
@@ -383,8 +903,8 @@ class ATLSATEncoding:
 		
 		elif operator in self.binary_operators:
 			
-			left_child = getValue(rowId, self.l)[0]
-			right_child = getValue(rowId, self.r)[0]
+			left_child = getChild(rowId, self.l, self.lb)
+			right_child = getChild(rowId, self.r, self.rb)
 			left_formula = self.reconstructFormula(model, left_child)
 			right_formula = self.reconstructFormula(model, right_child)
 
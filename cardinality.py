@@ -0,0 +1,89 @@
+from pysmt.shortcuts import Symbol, And, Or, Implies, Not, AtMostOne, TRUE
+
+cardinality_encodings = ['pairwise', 'seqcounter', 'commander', 'ladder']
+
+
+def at_most_one(literals, encoding='pairwise', name='amo'):
+	'''
+	At most one of the literals is true, as a formula; the encodings other than pairwise introduce
+	auxiliary variables, named after name, which must be unique per group of literals
+	'''
+	if len(literals) <= 1:
+		return TRUE()
+	if encoding == 'pairwise':
+		return AtMostOne(literals)
+	if encoding == 'seqcounter':
+		return sequential_counter(literals, name)
+	if encoding == 'commander':
+		return commander(literals, name)
+	if encoding == 'ladder':
+		return ladder(literals, name)
+	raise Exception('Unknown cardinality encoding %s'%encoding)
+
+
+def exactly_one(literals, encoding='pairwise', name='amo'):
+	return And(Or(literals), at_most_one(literals, encoding, name))
+
+
+def sequential_counter(literals, name):
+	'''
+	Sinz's sequential counter for k=1: s_i is true once one of the first i+1 literals is, and no
+	literal may be true after that; 3n clauses and n-1 auxiliary variables
+	'''
+	n = len(literals)
+	s = [Symbol('%s_sc_%d'%(name, i)) for i in range(n-1)]
+	constraints = [Implies(literals[0], s[0]), Implies(literals[n-1], Not(s[n-2]))]
+	for i in range(1, n-1):
+		constraints += [Implies(literals[i], s[i]), Implies(s[i-1], s[i]), Implies(literals[i], Not(s[i-1]))]
+	return And(constraints)
+
+
+def ladder(literals, name):
+	'''
+	Ladder encoding: the auxiliary variables form a ladder (y_{i+1} implies y_i) and literal i may only be
+	true at the step of the ladder, i.e. with y_{i-1} true and y_i false
+	'''
+	n = len(literals)
+	y = [Symbol('%s_ld_%d'%(name, i)) for i in range(n-1)]
+	constraints = [Implies(y[i+1], y[i]) for i in range(n-2)]
+	constraints += [Implies(literals[0], Not(y[0])), Implies(literals[n-1], y[n-2])]
+	constraints += [Implies(literals[i], And(y[i-1], Not(y[i]))) for i in range(1, n-1)]
+	return And(constraints)
+
+
+def commander(literals, name, group_size=3):
+	'''
+	Klieber and Kwon's commander encoding: pairwise at-most-one within groups of group_size literals,
+	a commander variable implied by every literal of its group, and recursively at most one commander
+	'''
+	if len(literals) <= group_size:
+		return AtMostOne(literals)
+	groups = [literals[pos:pos+group_size] for pos in range(0, len(literals), group_size)]
+	commanders = [Symbol('%s_cm_%d'%(name, pos)) for pos in range(len(groups))]
+	constraints = []
+	for group, cmd in zip(groups, commanders):
+		constraints.append(AtMostOne(group))
+		constraints += [Implies(literal, cmd) for literal in group]
+	constraints.append(commander(commanders, name + '_', group_size))
+	return And(constraints)
+
+
+def at_most(literals, bound, name='card'):
+	'''
+	At most bound of the literals are true, with Sinz's sequential counter: s_i_j is true once j+1 of the
+	first i+1 literals are; (n-1)*bound auxiliary variables
+	'''
+	n = len(literals)
+	if bound >= n:
+		return TRUE()
+	if bound == 0:
+		return And([Not(literal) for literal in literals])
+	s = [[Symbol('%s_sc_%d_%d'%(name, i, j)) for j in range(bound)] for i in range(n-1)]
+	constraints = [Implies(literals[0], s[0][0])] + [Not(s[0][j]) for j in range(1, bound)]
+	for i in range(1, n-1):
+		constraints.append(Implies(literals[i], s[i][0]))
+		constraints += [Implies(s[i-1][j], s[i][j]) for j in range(bound)]
+		constraints += [Implies(And(literals[i], s[i-1][j-1]), s[i][j]) for j in range(1, bound)]
+		constraints.append(Implies(literals[i], Not(s[i-1][bound-1])))
+	constraints.append(Implies(literals[n-1], Not(s[n-2][bound-1])))
+	return And(constraints)
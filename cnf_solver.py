@@ -0,0 +1,292 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from pysmt.shortcuts import Symbol, TRUE, FALSE
+from pysmt.operators import AND, OR, NOT, IMPLIES, IFF, SYMBOL, BOOL_CONSTANT
+
+
+def pysat_available():
+	try:
+		import pysat.solvers
+		return True
+	except ImportError:
+		return False
+
+
+class PySATBackend:
+	'''
+	In-process SAT solving through python-sat (pip install python-sat); name is any solver known
+	to pysat (cadical153, glucose4, minisat22, ...)
+	'''
+	def __init__(self, name='cadical153'):
+		from pysat.solvers import Solver as PySATSolver
+		self.name = name
+		self.solver_class = PySATSolver
+		self.solver = None
+		self.num_loaded = 0
+
+	def solve(self, clauses, assumptions, restart):
+		# clauses only get appended between two pops, so unless clauses were popped the live
+		# solver (and what it has learnt) is kept and only receives the new clauses
+		if self.solver is None or restart:
+			self.reset()
+			self.solver = self.solver_class(name=self.name)
+		for clause in clauses[self.num_loaded:]:
+			self.solver.add_clause(clause)
+		self.num_loaded = len(clauses)
+		if self.solver.solve(assumptions=assumptions):
+			return True, set(lit for lit in self.solver.get_model() if lit > 0)
+		return False, None
+
+	def reset(self):
+		if self.solver is not None:
+			self.solver.delete()
+		self.solver = None
+		self.num_loaded = 0
+
+
+class DimacsProcessBackend:
+	'''
+	Runs a locally installed DIMACS solver binary (kissat, cadical, glucose, ...) on a temporary .cnf
+	file; the solver is expected to follow the SAT competition output format ('s ...' and 'v ...' lines)
+	'''
+	def __init__(self, command):
+		self.name = command
+		self.command = command.split()
+
+	def solve(self, clauses, assumptions, restart):
+		with tempfile.NamedTemporaryFile('w', suffix='.cnf', delete=False) as cnf_file:
+			write_dimacs(cnf_file, clauses + [[lit] for lit in assumptions])
+		try:
+			result = subprocess.run(self.command + [cnf_file.name], capture_output=True, text=True)
+		finally:
+			os.remove(cnf_file.name)
+
+		status = None
+		model = set()
+		for line in result.stdout.splitlines():
+			if line.startswith('s '):
+				status = line[2:].strip()
+			elif line.startswith('v '):
+				model.update(int(lit) for lit in line[2:].split() if int(lit) > 0)
+		if status == 'SATISFIABLE':
+			return True, model
+		if status == 'UNSATISFIABLE':
+			return False, None
+		raise Exception('Solver %s did not report a result (exit code %d)'%(self.name, result.returncode))
+
+	def reset(self):
+		pass
+
+
+def make_backend(name):
+	'''A solver binary if name is a path or an executable on PATH, otherwise a pysat solver'''
+	if os.path.sep in name or shutil.which(name.split()[0]) is not None:
+		return DimacsProcessBackend(name)
+	if not pysat_available():
+		raise Exception('%s is neither an installed solver binary nor usable through python-sat (not installed)'%name)
+	return PySATBackend(name)
+
+
+def write_dimacs(file, clauses):
+	num_vars = max([abs(lit) for clause in clauses for lit in clause], default=0)
+	file.write('p cnf %d %d\n'%(num_vars, len(clauses)))
+	for clause in clauses:
+		file.write(' '.join(map(str, clause)) + ' 0\n')
+
+
+class CNFModel:
+	'''Assignment returned by CNFSolver, indexable by pysmt symbols like a pysmt model'''
+	def __init__(self, symbol_vars, true_vars):
+		self.symbol_vars = symbol_vars
+		self.true_vars = true_vars
+
+	def __getitem__(self, symbol):
+		if self.symbol_vars.get(symbol) in self.true_vars:
+			return TRUE()
+		return FALSE()
+
+	def get_py_value(self, symbol):
+		return self.symbol_vars.get(symbol) in self.true_vars
+
+
+class CNFSolver:
+	'''
+	Stand-in for the pysmt solver used by the encodings (add_assertion, push, pop, solve, get_model)
+	that Tseitin-encodes the asserted formulas into integer clauses itself and solves them with a
+	pluggable SAT backend, bypassing the formula conversion of the pysmt solvers.
+
+	Top-level conjunctions and implications are turned into clauses directly, only nested
+	subformulas get a Tseitin variable (cached per formula node, pysmt formulas being hash-consed).
+	Without a solver name the clauses are only collected (see parallel_encoding).
+	'''
+	def __init__(self, name='cadical153'):
+		self.name = name
+		self.backend = make_backend(name) if name != None else None
+		self.symbol_vars = {}
+		self.num_vars = 0
+		self.clauses = []
+		self.gates = {}
+		self.scopes = []
+		self.model = None
+		self.restart = False
+
+		self.true_var = self.newVar()
+		self.clauses.append([self.true_var])
+
+	def newVar(self):
+		self.num_vars += 1
+		return self.num_vars
+
+	def push(self):
+		self.scopes.append((len(self.clauses), []))
+
+	def pop(self):
+		num_clauses, gates = self.scopes.pop()
+		del self.clauses[num_clauses:]
+		for gate in gates:
+			del self.gates[gate]
+		self.restart = True
+
+	def add_assertion(self, formula):
+		self.addImplied([], formula)
+
+	def add_clauses(self, clauses, var_names, true_var, num_vars):
+		'''
+		Adds integer clauses over a foreign numbering of num_vars variables, in which var_names names
+		the variables of pysmt symbols and true_var is constant true; the other variables are shifted
+		past the variables of this solver
+		'''
+		offset = self.num_vars
+		self.num_vars += num_vars
+		signed = [0]*(2*num_vars + 1)
+		for var in range(1, num_vars + 1):
+			if var in var_names:
+				signed[num_vars + var] = self.literal(Symbol(var_names[var]))
+			elif var == true_var:
+				signed[num_vars + var] = self.true_var
+			else:
+				signed[num_vars + var] = offset + var
+			signed[num_vars - var] = -signed[num_vars + var]
+		self.clauses += [[signed[num_vars + lit] for lit in clause] for clause in clauses]
+
+	def solve(self, assumptions=None):
+		assumption_lits = [self.literal(assumption) for assumption in (assumptions or [])]
+		res, true_vars = self.backend.solve(self.clauses, assumption_lits, self.restart)
+		self.restart = False
+		self.model = CNFModel(self.symbol_vars, true_vars) if res else None
+		return res
+
+	def solve_maxsat(self, assumptions, soft):
+		'''
+		Solves the clauses with the assumptions as hard unit clauses, maximising the number of soft
+		literals satisfied, with the RC2 MaxSAT solver of python-sat; returns the number of soft literals
+		falsified, or None if the hard clauses are unsatisfiable
+		'''
+		from pysat.formula import WCNF
+		from pysat.examples.rc2 import RC2
+		wcnf = WCNF()
+		for clause in self.clauses + [[self.literal(assumption)] for assumption in assumptions]:
+			wcnf.append(clause)
+		for literal in soft:
+			wcnf.append([self.literal(literal)], weight=1)
+
+		with RC2(wcnf) as maxsat:
+			true_vars = maxsat.compute()
+			cost = maxsat.cost
+		self.model = CNFModel(self.symbol_vars, set(lit for lit in true_vars if lit > 0)) if true_vars != None else None
+		return cost if true_vars != None else None
+
+	def get_model(self):
+		return self.model
+
+	def dump(self, file_path, assumptions=None):
+		'''Writes the current clauses (and the assumptions as unit clauses) in DIMACS format'''
+		assumption_lits = [self.literal(assumption) for assumption in (assumptions or [])]
+		with open(file_path, 'w') as file:
+			write_dimacs(file, self.clauses + [[lit] for lit in assumption_lits])
+
+	def stats(self):
+		return {'CNF Variables': self.num_vars, 'CNF Clauses': len(self.clauses)}
+
+	def addImplied(self, premise, formula):
+		'''Adds the clauses of  (premise literals all true) -> formula'''
+		node_type = formula.node_type()
+
+		if node_type == AND:
+			for arg in formula.args():
+				self.addImplied(premise, arg)
+		elif node_type == OR:
+			self.clauses.append([-lit for lit in premise] + [self.literal(arg) for arg in self.flattenOr(formula)])
+		elif node_type == IMPLIES:
+			left, right = formula.args()
+			if left.node_type() == AND:
+				self.addImplied(premise + [self.literal(arg) for arg in left.args()], right)
+			else:
+				self.addImplied(premise + [self.literal(left)], right)
+		elif node_type == IFF:
+			left, right = formula.args()
+			left_lit, right_lit = self.literal(left), self.literal(right)
+			self.clauses.append([-lit for lit in premise] + [-left_lit, right_lit])
+			self.clauses.append([-lit for lit in premise] + [left_lit, -right_lit])
+		elif node_type == NOT and formula.arg(0).node_type() == OR:
+			for arg in self.flattenOr(formula.arg(0)):
+				self.clauses.append([-lit for lit in premise] + [-self.literal(arg)])
+		elif node_type == NOT and formula.arg(0).node_type() == AND:
+			self.clauses.append([-lit for lit in premise] + [-self.literal(arg) for arg in formula.arg(0).args()])
+		elif node_type == BOOL_CONSTANT:
+			if not formula.constant_value():
+				self.clauses.append([-lit for lit in premise])
+		else:
+			self.clauses.append([-lit for lit in premise] + [self.literal(formula)])
+
+	def flattenOr(self, formula):
+		args = []
+		for arg in formula.args():
+			if arg.node_type() == OR:
+				args += self.flattenOr(arg)
+			else:
+				args.append(arg)
+		return args
+
+	def literal(self, formula):
+		'''Literal equivalent to the formula, introducing Tseitin variables for the gates'''
+		node_type = formula.node_type()
+
+		if node_type == SYMBOL:
+			if formula not in self.symbol_vars:
+				self.symbol_vars[formula] = self.newVar()
+			return self.symbol_vars[formula]
+		if node_type == NOT:
+			return -self.literal(formula.arg(0))
+		if node_type == BOOL_CONSTANT:
+			return self.true_var if formula.constant_value() else -self.true_var
+		if formula in self.gates:
+			return self.gates[formula]
+
+		if node_type == AND:
+			args = [self.literal(arg) for arg in formula.args()]
+			var = self.newVar()
+			self.clauses += [[-var, arg] for arg in args]
+			self.clauses.append([var] + [-arg for arg in args])
+		elif node_type == OR:
+			args = [self.literal(arg) for arg in self.flattenOr(formula)]
+			var = self.newVar()
+			self.clauses += [[var, -arg] for arg in args]
+			self.clauses.append([-var] + args)
+		elif node_type == IMPLIES:
+			left, right = self.literal(formula.arg(0)), self.literal(formula.arg(1))
+			var = self.newVar()
+			self.clauses += [[var, left], [var, -right], [-var, -left, right]]
+		elif node_type == IFF:
+			left, right = self.literal(formula.arg(0)), self.literal(formula.arg(1))
+			var = self.newVar()
+			self.clauses += [[-var, -left, right], [-var, left, -right], [var, left, right], [var, -left, -right]]
+		else:
+			raise Exception('Unsupported formula for the CNF backend: %s'%formula)
+
+		self.gates[formula] = var
+		if self.scopes:
+			self.scopes[-1][1].append(formula)
+		return var
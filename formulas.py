@@ -143,6 +143,18 @@ class CTLFormula(SimpleTree):
 				return lb + self.left.prettyPrint() + rb + self.label + lb + self.right.prettyPrint() + rb
 
 	
+	def canonicalForm(self):
+		'''Text of the formula with the operands of the commutative operators in a fixed order'''
+		if self._isLeaf():
+			return self.label
+		left = self.left.canonicalForm()
+		if self.right is None:
+			return '%s(%s)'%(self.label, left)
+		right = self.right.canonicalForm()
+		if self.label in ctl_commutative:
+			left, right = sorted([left, right])
+		return '%s(%s,%s)'%(self.label, left, right)
+
 	def getAllVariables(self):
 		allNodes = list(set(self.getAllNodes()))
 		return [ node for node in allNodes if node._isLeaf() == True ]
@@ -201,11 +213,13 @@ class CTLFormula(SimpleTree):
 						|_unary_expression
 						| constant
 						| variable
+						| hole
 				!constant: "true"
 						| "false"
 				_binary_expression: binary_operator "(" formula "," formula ")"
 				_unary_expression: unary_operator "(" formula ")"
 				variable: /[a-z]/
+				hole: "?"
 				!binary_operator: "&" | "|" | "->" | "EU" | "AU"
 				!unary_operator: "!" | "EX" | "AF" | "AG" | "AX" | "EF" | "EG"
 				
@@ -229,6 +243,8 @@ class TreeToCTLFormula(Transformer):
 			return CTLFormula(formulaArgs)
 		def variable(self, varName):
 			return CTLFormula([str(varName[0]), None, None])
+		def hole(self, args):
+			return CTLFormula(['?', None, None])
 		def constant(self, arg):
 			connector = ""
 			if str(arg[0]) == "true":
@@ -250,9 +266,10 @@ class ATLFormula(SimpleTree):
 		self.size = None
 		if not isinstance(formulaArg, str):
 			self.label = formulaArg[0]
-			if self.label[-1] in atl_temporal:
+			if self.label[-1] in atl_temporal and '?' not in self.label:
 				self.players = set(int(digit) for digit in formulaArg[0].split('<')[1].split('>')[0])
 			else:
+				# not a temporal operator, or a template operator whose coalition is a hole (<?>)
 				self.players = None
 			self.left = formulaArg[1]
 			try:
@@ -309,6 +326,18 @@ class ATLFormula(SimpleTree):
 			if self.label[-1] in atl_binary:
 				return '<' + ','.join(map(str,self.players)) + '>' + lb + self.left.prettyPrint() + " " +  temporal_operator + " " + self.right.prettyPrint() + rb
 
+	def canonicalForm(self):
+		'''Text of the formula with the operands of the commutative operators in a fixed order'''
+		if self._isLeaf():
+			return self.label
+		left = self.left.canonicalForm()
+		if self.right is None:
+			return '%s(%s)'%(self.label, left)
+		right = self.right.canonicalForm()
+		if self.label in atl_commutative:
+			left, right = sorted([left, right])
+		return '%s(%s,%s)'%(self.label, left, right)
+
 	def getAllVariables(self):
 		allNodes = list(set(self.getAllNodes()))
 		return [ node for node in allNodes if node._isLeaf() == True ]
@@ -369,14 +398,17 @@ class ATLFormula(SimpleTree):
 						| _temporal_binary_expression_						
 						| constant
 						| variable
+						| hole
 				!constant: "true"
 						| "false"
 				_binary_expression: binary_operator "(" formula "," formula ")"
 				_unary_expression: unary_operator "(" formula ")"
-				_temporal_unary_expression_: players unary_operator "(" formula ")"
-				_temporal_binary_expression_: players binary_operator "(" formula "," formula ")"
+				_temporal_unary_expression_: (players | coalition_hole) unary_operator "(" formula ")"
+				_temporal_binary_expression_: (players | coalition_hole) binary_operator "(" formula "," formula ")"
 				variable: /[a-z]/
+				hole: "?"
 				players: "<" /[0-9]+/ ">" | "<>"
+				coalition_hole: "<?>"
 				!binary_operator: "&" | "|" | "->" | "U"
 				!unary_operator: "!" | "X" | "F" | "G"
 				
@@ -407,6 +439,12 @@ class TreeToATLFormula(Transformer):
 		
 		def variable(self, varName):
 			return ATLFormula([str(varName[0]), None, None])
+
+		def hole(self, args):
+			return ATLFormula(['?', None, None])
+
+		def coalition_hole(self, args):
+			return '<?>'
 		
 		def constant(self, arg):
 			connector = ""
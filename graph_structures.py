@@ -65,6 +65,190 @@ def generate_random_cgs(max_in_deg, max_out_deg, num_states, transition_density,
 	return rand_cgs
 
 
+def strongly_connected_components(states, successors):
+	'''
+	Tarjan's algorithm (iterative); returns the SCCs in reverse topological order of the condensation
+	'''
+	index = {}
+	lowlink = {}
+	on_stack = set()
+	stack = []
+	sccs = []
+	counter = 0
+	for root in states:
+		if root in index:
+			continue
+		index[root] = lowlink[root] = counter
+		counter += 1
+		stack.append(root)
+		on_stack.add(root)
+		work = [(root, iter(successors(root)))]
+		while work:
+			state, succ_iter = work[-1]
+			advanced = False
+			for succ in succ_iter:
+				if succ not in index:
+					index[succ] = lowlink[succ] = counter
+					counter += 1
+					stack.append(succ)
+					on_stack.add(succ)
+					work.append((succ, iter(successors(succ))))
+					advanced = True
+					break
+				elif succ in on_stack:
+					lowlink[state] = min(lowlink[state], index[succ])
+			if advanced:
+				continue
+			work.pop()
+			if work:
+				lowlink[work[-1][0]] = min(lowlink[work[-1][0]], lowlink[state])
+			if lowlink[state] == index[state]:
+				scc = set()
+				while True:
+					member = stack.pop()
+					on_stack.discard(member)
+					scc.add(member)
+					if member == state:
+						break
+				sccs.append(scc)
+	return sccs
+
+def fixpoint_bound(states, successors):
+	'''
+	Upper bound on the number of iterations any fixpoint (least or greatest, existential, universal or
+	coalition pre-image) needs to converge on a structure: a state that changes in iteration d has a
+	successor that changed in iteration d-1, so d is bounded by the length of a simple path. The latter is
+	bounded by the heaviest path of the SCC condensation weighted by the SCC sizes (minus one). A state
+	without successors already changes in the first iteration (EX of anything is false there, AX true),
+	which takes one more layer, so the full weight is returned then.
+	'''
+	sccs = strongly_connected_components(states, successors)
+	scc_of = {state: scc_id for scc_id, scc in enumerate(sccs) for state in scc}
+	heaviest = {}
+	# sccs come in reverse topological order, so successors are settled first
+	for scc_id, scc in enumerate(sccs):
+		succ_sccs = {scc_of[succ] for state in scc for succ in successors(state)} - {scc_id}
+		heaviest[scc_id] = len(scc) + max([heaviest[succ_id] for succ_id in succ_sccs], default=0)
+	if any(not successors(state) for state in states):
+		return max(heaviest.values())
+	return max(max(heaviest.values(), default=1) - 1, 0)
+
+def reachability_bound(states, successors):
+	'''
+	Number of iterations the existential reachability fixpoint (EF, and AG by duality) needs to converge:
+	the largest finite shortest-path distance between two states
+	'''
+	bound = 0
+	for source in states:
+		dist = {source: 0}
+		frontier = [source]
+		while frontier:
+			next_frontier = []
+			for state in frontier:
+				for succ in successors(state):
+					if succ not in dist:
+						dist[succ] = dist[state] + 1
+						next_frontier.append(succ)
+			frontier = next_frontier
+		bound = max(bound, max(dist.values()))
+	return bound
+
+
+def reachable_states(init_states, successors):
+	'''States reachable from the initial states'''
+	reachable = set(init_states)
+	stack = list(init_states)
+	while stack:
+		state = stack.pop()
+		for succ in successors(state):
+			if succ not in reachable:
+				reachable.add(succ)
+				stack.append(succ)
+	return reachable
+
+
+def refine_partition(states, initial_class, signature):
+	'''
+	Coarsest partition of the states refining initial_class (state -> hashable) that is stable
+	under signature(state, block), where block maps the states to their current block; the blocks
+	are returned as a map from the states to block numbers 0, 1, ...
+	'''
+	states = sorted(states)
+	def number(keys):
+		numbers = {}
+		return {state: numbers.setdefault(keys[state], len(numbers)) for state in states}
+
+	block = number({state: initial_class(state) for state in states})
+	while True:
+		refined = number({state: (block[state], signature(state, block)) for state in states})
+		if len(set(refined.values())) == len(set(block.values())):
+			return refined
+		block = refined
+
+
+def connected_components(states, successors):
+	'''Weakly connected components, ordered by their smallest states'''
+	neighbours = {state: set() for state in states}
+	for state in states:
+		for succ in successors(state):
+			neighbours[state].add(succ)
+			neighbours[succ].add(state)
+	components = []
+	visited = set()
+	for state in sorted(states):
+		if state in visited:
+			continue
+		component = reachable_states({state}, lambda state: neighbours[state])
+		visited |= component
+		components.append(component)
+	return components
+
+
+def union_kripkes(kripkes):
+	'''
+	Disjoint union of Kripke structures, state s of the k-th structure being state offsets[k]+s;
+	returns the union and the offsets
+	'''
+	offsets = []
+	init_states, transitions, labels, propositions = set(), {}, {}, set()
+	offset = 0
+	for kripke in kripkes:
+		offsets.append(offset)
+		init_states |= set(offset + state for state in kripke.init_states)
+		transitions.update({offset + state: set(offset + succ for succ in kripke.transitions[state]) for state in kripke.states})
+		labels.update({offset + state: set(kripke.labels[state]) for state in kripke.states})
+		propositions |= set(kripke.propositions)
+		offset += max(kripke.states) + 1
+	union = Kripke(init_states=init_states, transitions=transitions, labels=labels, propositions=propositions)
+	union.calc_stats()
+	union.propositions = propositions
+	return union, offsets
+
+
+def union_cgss(cgss):
+	'''
+	Disjoint union of CGSs over the same players, state s of the k-th structure being state offsets[k]+s;
+	returns the union and the offsets
+	'''
+	offsets = []
+	init_states, transitions, labels, state_player, propositions = set(), {}, {}, {}, set()
+	offset = 0
+	for cgs in cgss:
+		offsets.append(offset)
+		init_states |= set(offset + state for state in cgs.init_states)
+		transitions.update({offset + state: {action: offset + succ for action, succ in cgs.transitions[state].items()} for state in cgs.states})
+		labels.update({offset + state: set(cgs.labels[state]) for state in cgs.states})
+		state_player.update({offset + state: player for state, player in cgs.state_player.items()})
+		propositions |= set(cgs.propositions)
+		offset += max(cgs.states) + 1
+	union = ConcurrentGameStructure(init_states=init_states, transitions=transitions, labels=labels, players=list(cgss[0].players),\
+								propositions=propositions, turn_based=cgss[0].turn_based)
+	union.state_player = state_player
+	union.calc_stats()
+	union.propositions = propositions
+	return union, offsets
+
+
 class Kripke:
 	def __init__(self, init_states=set(), transitions={}, labels={}, propositions=set()):
 		self.init_states = init_states
@@ -90,6 +274,55 @@ class Kripke:
 	def predecessors(self, state):
 		return {s for s in self.states if state in self.transitions[s]}
 
+	def fixpoint_bound(self):
+		'''Number of iterations after which the fixpoints of EG, AF, EU and AU have converged'''
+		return fixpoint_bound(self.states, self.successors)
+
+	def reachability_bound(self):
+		'''Number of iterations after which the fixpoints of EF and AG have converged'''
+		return reachability_bound(self.states, self.successors)
+
+	def restrict_to_reachable(self):
+		'''Removes the states unreachable from the initial states and returns how many were removed'''
+		reachable = reachable_states(self.init_states, self.successors)
+		num_removed = len(self.states) - len(reachable)
+		propositions = self.propositions
+		self.states = reachable
+		self.labels = {state: self.labels[state] for state in reachable}
+		self.transitions = {state: self.transitions[state] for state in reachable}
+		self.calc_stats()
+		# propositions only labelling removed states stay part of the vocabulary
+		self.propositions = propositions
+		return num_removed
+
+	def bisimulation_classes(self):
+		'''Map from the states to the numbers of their bisimulation classes'''
+		return refine_partition(self.states, lambda state: frozenset(self.labels[state]),\
+						  lambda state, block: frozenset(block[succ] for succ in self.transitions[state]))
+
+	def bisimulation_quotient(self, block=None):
+		'''
+		Kripke structure whose states are the bisimulation classes of the states of this one; CTL
+		does not distinguish bisimilar states, so both satisfy the same formulas
+		'''
+		if block is None:
+			block = self.bisimulation_classes()
+		transitions = {block[state]: set(block[succ] for succ in self.transitions[state]) for state in self.states}
+		labels = {block[state]: set(self.labels[state]) for state in self.states}
+		quotient = Kripke(init_states=set(block[state] for state in self.init_states), transitions=transitions,\
+						labels=labels, propositions=set(self.propositions))
+		quotient.calc_stats()
+		quotient.propositions = set(self.propositions)
+		return quotient
+
+	def substructure(self, states, init_states):
+		'''Kripke structure on a set of states closed under successors'''
+		kripke = Kripke(init_states=set(init_states), transitions={state: set(self.transitions[state]) for state in states},\
+						labels={state: set(self.labels[state]) for state in states}, propositions=set(self.propositions))
+		kripke.calc_stats()
+		kripke.propositions = set(self.propositions)
+		return kripke
+
 	def read_structure_file(self, file_path):
 		with open(file_path, 'r') as file:
 			lines = file.read()
@@ -484,6 +717,72 @@ class ConcurrentGameStructure:
 	def predecessors(self, state):
 		return {s for s in self.states for action in self.transitions[s] if self.transitions[s][action] == state}
 
+	def fixpoint_bound(self):
+		'''Number of iterations after which the fixpoints of <A>F, <A>G and <A>U have converged, for every coalition A'''
+		return fixpoint_bound(self.states, self.successors)
+
+	def restrict_to_reachable(self):
+		'''Removes the states unreachable from the initial states and returns how many were removed'''
+		reachable = reachable_states(self.init_states, self.successors)
+		num_removed = len(self.states) - len(reachable)
+		propositions = self.propositions
+		self.states = reachable
+		self.labels = {state: self.labels[state] for state in reachable}
+		self.transitions = {state: self.transitions[state] for state in reachable}
+		self.state_player = {state: self.state_player[state] for state in self.state_player if state in reachable}
+		self.calc_stats()
+		# propositions only labelling removed states stay part of the vocabulary
+		self.propositions = propositions
+		return num_removed
+
+	def bisimulation_classes(self):
+		'''
+		Map from the states to the numbers of the classes of an alternating bisimulation. States are
+		in the same class when they have the same labels and, in a turn-based structure, the same
+		owner and the same successor classes, or, in a concurrent one, the same successor class for
+		every action profile.
+		'''
+		if self.turn_based:
+			initial_class = lambda state: (frozenset(self.labels[state]), self.state_player[state])
+			signature = lambda state, block: frozenset(block[succ] for succ in self.successors(state))
+		else:
+			initial_class = lambda state: frozenset(self.labels[state])
+			signature = lambda state, block: frozenset((action, block[self.transitions[state][action]]) for action in self.transitions[state])
+		return refine_partition(self.states, initial_class, signature)
+
+	def bisimulation_quotient(self, block=None):
+		'''
+		CGS whose states are the classes of an alternating bisimulation of the states of this one
+		(see bisimulation_classes), so that both satisfy the same ATL formulas; every class keeps the
+		action profiles of its smallest state
+		'''
+		if block is None:
+			block = self.bisimulation_classes()
+
+		representative = {}
+		for state in sorted(self.states):
+			representative.setdefault(block[state], state)
+		transitions = {cls: {action: block[succ] for action, succ in self.transitions[state].items()}\
+						for cls, state in representative.items()}
+		labels = {cls: set(self.labels[state]) for cls, state in representative.items()}
+		quotient = ConcurrentGameStructure(init_states=set(block[state] for state in self.init_states), transitions=transitions,\
+										labels=labels, players=list(self.players), propositions=set(self.propositions),\
+										turn_based=self.turn_based)
+		quotient.state_player = {cls: self.state_player[state] for cls, state in representative.items() if state in self.state_player}
+		quotient.calc_stats()
+		quotient.propositions = set(self.propositions)
+		return quotient
+
+	def substructure(self, states, init_states):
+		'''CGS on a set of states closed under successors'''
+		cgs = ConcurrentGameStructure(init_states=set(init_states), transitions={state: dict(self.transitions[state]) for state in states},\
+									labels={state: set(self.labels[state]) for state in states}, players=list(self.players),\
+									propositions=set(self.propositions), turn_based=self.turn_based)
+		cgs.state_player = {state: self.state_player[state] for state in states if state in self.state_player}
+		cgs.calc_stats()
+		cgs.propositions = set(self.propositions)
+		return cgs
+
 	def predecessors_players(self, target_states, players):
 		'''Returns the predecessors of a state wrt to give players'''
 		
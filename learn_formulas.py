@@ -1,31 +1,107 @@
 import argparse
+import os
 import json
 import time
-from sample import SampleKripke, SampleCGS, consistency_checker
+import multiprocessing
+import queue
+from pysmt.shortcuts import get_env
+from pysmt.logics import QF_BOOL
+from formulas import CTLFormula, ATLFormula
+from sample import SampleKripke, SampleCGS, consistency_checker, misclassified_structures, structure_pool
 from operators import *
 from ctl_encoding import CTLSATEncoding
 from atl_encoding import ATLSATEncoding
+from cardinality import cardinality_encodings
 import cProfile
 
 class LearnFramework:
 
 	def __init__(self, sample_file='tests/inputs/example_sample.sp', size_bound=10,\
-			  			 operators=ctl_operators, solver_name='z3', cgs=False, atl=False, turn=True):
+			  			 operators=ctl_operators, solver_name='z3', cgs=False, atl=False, turn=True, child_mux=False,\
+						 temporal_encoding='unroll', backend='pysmt', dump_cnf=None,\
+						 symmetry_breaking=[], incremental='assume', cegis=False, cegis_init=1,\
+						 workers=1, prune_unreachable=True, reduce_structures=True, shared_states=False,\
+						 leaf_constants=False, cardinality='pairwise', child_index='onehot',\
+						 semantic_uniqueness=False, optimise=False, size_workers=1, portfolio=None,\
+						 noise=0, noise_solver='cardinality', lazy_depth=None, template=None,\
+						 label_files=None):
 		self.sample_file = sample_file
 		self.size_bound = size_bound
 		self.operators = operators
 		self.solver_name = solver_name
-		self.json_file = sample_file.split('.')[0] +'-'+solver_name+'.json'
+		# runs of the two incremental modes keep their metadata, e.g. the per-size times, side by side
+		self.json_file = sample_file.split('.')[0] +'-'+os.path.basename(solver_name.split()[0])+\
+						('' if incremental == 'assume' else '-'+incremental)+'.json'
 		self.cgs = cgs
 		self.formula_type = 'atl' if atl else 'ctl'
 		self.model_type = 'cgs' if cgs else 'kripke'
 		self.turn = turn
+		self.child_mux = child_mux
+		self.temporal_encoding = temporal_encoding
+		self.backend = backend
+		self.dump_cnf = dump_cnf
+		self.symmetry_breaking = symmetry_breaking
+		self.incremental = incremental
+		self.cegis = cegis
+		self.cegis_init = cegis_init
+		self.workers = workers
+		self.prune_unreachable = prune_unreachable
+		self.reduce_structures = reduce_structures
+		self.shared_states = shared_states
+		self.leaf_constants = leaf_constants
+		self.cardinality = cardinality
+		self.child_index = child_index
+		self.semantic_uniqueness = semantic_uniqueness
+		self.optimise = optimise
+		self.size_workers = size_workers
+		self.portfolio = portfolio
+		self.noise = noise
+		self.noise_solver = noise_solver
+		self.lazy_depth = lazy_depth
+		self.template = template
+		self.label_files = label_files
+		self.template_formula = None
+		if self.template != None:
+			self.template_formula = (ATLFormula if atl else CTLFormula).convertTextToFormula(self.template)
+		if self.noise_solver == 'maxsat' and self.backend != 'cnf':
+			raise Exception('The MaxSAT noise solver requires the cnf backend')
+		if self.noise_solver == 'maxsat' and self.optimise:
+			raise Exception('The MaxSAT noise solver cannot be combined with the optimisation mode')
+		if self.portfolio == []:
+			if self.backend == 'cnf':
+				raise Exception('The solvers of a cnf backend portfolio must be named')
+			self.portfolio = installed_solvers()
+		if self.dump_cnf != None and self.backend != 'cnf':
+			raise Exception('Dumping CNF files requires the cnf backend')
+		if self.workers > 1 and self.backend != 'cnf':
+			raise Exception('Parallel encoding workers require the cnf backend')
+		if self.semantic_uniqueness and self.cegis:
+			raise Exception('Semantic uniqueness of the rows cannot be combined with CEGIS')
+		if self.optimise and (self.cegis or self.incremental != 'assume'):
+			raise Exception('The optimisation mode requires assumption-based solving and no CEGIS')
+		if self.optimise and self.size_workers > 1:
+			raise Exception('The optimisation mode and the size portfolio are exclusive')
+		if self.portfolio != None and (self.optimise or self.size_workers > 1):
+			raise Exception('The solver portfolio excludes the optimisation mode and the size portfolio')
+		if self.lazy_depth != None and (self.noise > 0 or self.optimise):
+			raise Exception('The lazy unrolling cannot be combined with a noise budget or the optimisation mode')
+		if self.template != None and (self.optimise or self.lazy_depth != None):
+			raise Exception('A template cannot be combined with the optimisation mode or the lazy unrolling')
+		if self.label_files != None and (self.cegis or self.optimise or self.noise > 0 or self.lazy_depth != None\
+										or self.size_workers > 1 or self.portfolio != None):
+			raise Exception('The multi-label mode only supports the plain size search (no CEGIS, optimisation, noise, lazy unrolling or portfolios)')
+		if self.cegis and self.incremental != 'assume':
+			raise Exception('CEGIS requires assumption-based incremental solving')
 
 		# Time stats
 		self.enc_time = 0
 		self.solving_time = 0
+		self.checking_time = 0
 		self.total_time = 0
 
+		self.size_solving_times = []
+		self.cegis_iterations = 0
+
 		# Learning stats
 		self.learned_formula = None
 		self.learned_formula_size = None
@@ -33,6 +109,10 @@ class LearnFramework:
 		if self.cgs:
 			self.sample = SampleCGS(positive=[], negative=[], propositions=[])
 			self.sample.read_sample(self.sample_file)
+			self.labellings = self.read_labellings(SampleCGS) if self.label_files != None else None
+			self.removed_states = self.sample.restrict_to_reachable() if self.prune_unreachable else 0
+			# the structures are encoded up to alternating bisimilarity, the learned formula is verified on the sample itself
+			self.encoded_sample = self.sample.bisimulation_quotient() if self.reduce_structures else self.sample
 
 			og_formula_text = None
 			if self.sample.formula != None:
@@ -51,6 +131,10 @@ class LearnFramework:
 		else:
 			self.sample = SampleKripke(positive=[], negative=[], propositions=[])
 			self.sample.read_sample(self.sample_file)
+			self.labellings = self.read_labellings(SampleKripke) if self.label_files != None else None
+			self.removed_states = self.sample.restrict_to_reachable() if self.prune_unreachable else 0
+			# the structures are encoded up to bisimilarity, the learned formula is verified on the sample itself
+			self.encoded_sample = self.sample.bisimulation_quotient() if self.reduce_structures else self.sample
 			og_formula_text = None
 			if self.sample.formula != None:
 				og_formula_text = self.sample.formula.prettyPrint()
@@ -64,6 +148,24 @@ class LearnFramework:
 							'Model Type': self.model_type, 'Formula Type': self.formula_type
 							}
 		
+		# number of structures the formula may misclassify
+		self.noise_budget = int(self.noise*self.sample.num_total) if self.noise > 0 else None
+
+		self.metadata.update({'Child Multiplexing': self.child_mux, 'Temporal Encoding': self.temporal_encoding,
+							'Backend': self.backend, 'Symmetry Breaking': self.symmetry_breaking,
+							'Incremental Solving': self.incremental,
+							'CEGIS': self.cegis, 'Encoding Workers': self.workers,
+							'Unreachable States Removed': self.removed_states, 'Shared States': self.shared_states,
+							'Leaf Constants': self.leaf_constants, 'Cardinality Encoding': self.cardinality,
+							'Child Index': self.child_index, 'Semantic Uniqueness': self.semantic_uniqueness,
+							'Optimisation': self.optimise, 'Size Workers': self.size_workers,
+							'Solver Portfolio': self.portfolio,
+							'Noise Budget': self.noise_budget, 'Noise Solver': self.noise_solver,
+							'Lazy Depth': self.lazy_depth, 'Template': self.template, 'Label Files': self.label_files,
+							'States': sum(structure.size for structure in self.sample.positive + self.sample.negative),
+							'Encoded States': sum(structure.size for structure in self.encoded_sample.positive + self.encoded_sample.negative),
+							'Structure Reductions': ['%d->%d'%(structure.size, encoded.size) for structure, encoded in\
+													zip(self.sample.positive + self.sample.negative, self.encoded_sample.positive + self.encoded_sample.negative)]})
 		self.dump_json(self.json_file)
 
 
@@ -72,49 +174,64 @@ class LearnFramework:
 		print('Learning CTL Formula from sample %s'%self.sample_file)
 		formula = None
 		enc_time_incr = time.time()
-		enc = CTLSATEncoding(self.sample, self.sample.propositions, self.operators, self.solver_name, neg_props=neg_props)
+		enc = self.new_encoding(self.solver_name, neg_props)
 		enc_time_incr = time.time() - enc_time_incr
 		self.enc_time += enc_time_incr
-
-		for size in range(1,self.size_bound+1):
-			print('--- Preparing encoding for size %d ---'%size)
-			# Propositional Encoding
-			enc_time_incr = time.time() 
-			enc.encodeFormula(size)
-			enc_time_incr = time.time() - enc_time_incr
-			self.enc_time += enc_time_incr
-
-			# SAT solving
-			solving_time_incr = time.time()
-			solverRes = enc.solver.solve()
-			solving_time_incr = time.time() - solving_time_incr
-			self.solving_time += solving_time_incr
+		self.enc_time_init = enc_time_incr
+
+		if self.optimise:
+			formula, size = self.optimise_size(enc)
+			total_time = round(self.enc_time + self.solving_time,2)
+		elif self.size_workers > 1:
+			formula, size, total_time = self.size_portfolio(enc)
+		elif self.portfolio != None:
+			formula, size = self.solver_portfolio(neg_props)
+			total_time = round(self.enc_time + self.solving_time + self.checking_time,2)
+		else:
+			for size in range(1,self.size_bound+1):
+				print('--- Preparing encoding for size %d ---'%size)
+				# Propositional Encoding
+				enc_time_incr = time.time() 
+				enc.encodeFormula(size)
+				enc_time_incr = time.time() - enc_time_incr
+				self.enc_time += enc_time_incr
+				if self.dump_cnf != None:
+					enc.solver.dump(self.cnf_file(size), enc.assumptions(size))
+
+				# SAT solving
+				formula = self.solve_size(enc, size)
 			
-			print('Size %d took %.2f seconds'%(size, enc_time_incr+solving_time_incr))
+				print('Size %d took %.2f seconds'%(size, enc_time_incr+self.size_solving_times[-1]))
+
+				total_time = round(self.enc_time + self.solving_time + self.checking_time,2)
+				if formula != None:
+					print("Found formula {} in time {}".format(formula.prettyPrint(), total_time))
+					break
 
-			if solverRes == True:
-				#print('sat')
-				solverModel = enc.solver.get_model()
-				#for var in solverModel:
-				#	if solverModel[var[0]].is_true():
-				#		print(var)
-				formula = enc.reconstructWholeFormula(solverModel, size)
-				total_time = round(self.enc_time + self.solving_time,2)
-				print("Found formula {} in time {}".format(formula.prettyPrint(), total_time))
-				break
-		
 		# Formula verification
+		ver = None
 		if formula != None:
-			ver = consistency_checker(self.sample, formula, self.model_type, self.formula_type)
+			ver = self.verify(formula)
 			print('Verification',ver)
 			if not ver:
 				raise Exception('Incorrect Formula found')
 		else:		
-			print('No formula found within %d size bound'%size)
+			print('No formula found within %d size bound'%self.size_bound)
+			size = None
 
 		self.metadata.update({'Encoding Time':round(self.enc_time,2), 'Solving Time': round(self.solving_time,2),
-							'Total Time': total_time, 'Learned Formula': formula.prettyPrint(),
-							'Learned Formula Size': size, 'Verification': ver})
+							'Total Time': total_time, 'Learned Formula': formula.prettyPrint() if formula != None else None,
+							'Learned Formula Size': size, 'Verification': ver,
+							'Size Solving Times': self.size_solving_times})
+		self.metadata.update(enc.stats)
+		self.metadata.update({'Encoded States': sum(structure.size for structure in enc.structures)})
+		if self.cegis:
+			self.metadata.update({'Model Checking Time': round(self.checking_time,2), 'CEGIS Iterations': self.cegis_iterations,
+								'CEGIS Structures': len(enc.active)})
+		if self.lazy_depth != None:
+			self.metadata.update({'Unrolled Depth': sum(enc.unroll.values())})
+		if self.backend == 'cnf':
+			self.metadata.update(enc.solver.stats())
 
 		self.dump_json(self.json_file)
 
@@ -126,62 +243,484 @@ class LearnFramework:
 		formula = None
 
 		enc_time_incr = time.time()
-		enc = ATLSATEncoding(self.sample, self.sample.propositions, self.operators, self.solver_name, self.turn)
+		enc = self.new_encoding(self.solver_name)
 		enc_time_incr = time.time() - enc_time_incr
 		self.enc_time += enc_time_incr
-
-		for size in range(1,self.size_bound+1):
-			print('--- Preparing encoding for size %d ---'%size)
-			# Propositional Encoding
-			enc_time_incr = time.time() 
-			enc.encodeFormula(size)
-			enc_time_incr = time.time() - enc_time_incr
-			self.enc_time += enc_time_incr
+		self.enc_time_init = enc_time_incr
+
+		if self.optimise:
+			formula, size = self.optimise_size(enc)
+			total_time = round(self.enc_time + self.solving_time,2)
+		elif self.size_workers > 1:
+			formula, size, total_time = self.size_portfolio(enc)
+		elif self.portfolio != None:
+			formula, size = self.solver_portfolio()
+			total_time = round(self.enc_time + self.solving_time + self.checking_time,2)
+		else:
+			for size in range(1,self.size_bound+1):
+				print('--- Preparing encoding for size %d ---'%size)
+				# Propositional Encoding
+				enc_time_incr = time.time() 
+				enc.encodeFormula(size)
+				enc_time_incr = time.time() - enc_time_incr
+				self.enc_time += enc_time_incr
+				if self.dump_cnf != None:
+					enc.solver.dump(self.cnf_file(size), enc.assumptions(size))
 			
-			# SAT solving
-			solving_time_incr = time.time()
-			solverRes = enc.solver.solve()
-			solving_time_incr = time.time() - solving_time_incr
-			self.solving_time += solving_time_incr
+				# SAT solving
+				formula = self.solve_size(enc, size)
 			
-			print('Size %d took %.2f seconds'%(size, enc_time_incr+solving_time_incr))
+				print('Size %d took %.2f seconds'%(size, enc_time_incr+self.size_solving_times[-1]))
+
+				total_time = round(self.enc_time + self.solving_time + self.checking_time,2)
+				if formula != None:
+					print("Found formula {} in time {}".format(formula.prettyPrint(), total_time))
+					break
 
-			if solverRes == True:
-				#print('sat')
-				solverModel = enc.solver.get_model()
-				#for var in solverModel:
-				#	if solverModel[var[0]].is_true():
-				#		print(var)
-				formula = enc.reconstructWholeFormula(solverModel, size)
-				total_time = round(self.enc_time + self.solving_time,2)
-				print("Found formula {} in time {}".format(formula.prettyPrint(), total_time))
-				break
-			
-			
-		
 		# Formula verification
+		ver = None
 		if formula != None:
-			ver = consistency_checker(self.sample, formula, self.model_type, self.formula_type)
+			ver = self.verify(formula)
 			print('Verification',ver)
 			if not ver:
 				raise Exception('Incorrect Formula found')
 		else:		
-			print('No formula found within %d size bound'%size)
+			print('No formula found within %d size bound'%self.size_bound)
+			size = None
 
 		self.metadata.update({'Encoding Time':round(self.enc_time,2), 'Solving Time': round(self.solving_time,2),
-							'Total Time': round(self.enc_time + self.solving_time,2), 'Learned Formula': formula.prettyPrint(),
-							'Learned Formula Size': size, 'Verification': ver})
+							'Total Time': total_time, 'Learned Formula': formula.prettyPrint() if formula != None else None,
+							'Learned Formula Size': size, 'Verification': ver,
+							'Size Solving Times': self.size_solving_times})
+		self.metadata.update(enc.stats)
+		self.metadata.update({'Encoded States': sum(structure.size for structure in enc.structures)})
+		if self.cegis:
+			self.metadata.update({'Model Checking Time': round(self.checking_time,2), 'CEGIS Iterations': self.cegis_iterations,
+								'CEGIS Structures': len(enc.active)})
+		if self.lazy_depth != None:
+			self.metadata.update({'Unrolled Depth': sum(enc.unroll.values())})
+		if self.backend == 'cnf':
+			self.metadata.update(enc.solver.stats())
 
 		self.dump_json(self.json_file)
 
 		return formula
 
 
+	def optimise_size(self, enc):
+		'''
+		Encodes all sizes up to the size bound once and searches the minimal one on the same solver:
+		every model gives a consistent size, the next search is bounded below it, until unsatisfiable
+		'''
+		print('--- Preparing encoding for sizes 1 to %d ---'%self.size_bound)
+		enc_time_incr = time.time()
+		for size in range(1,self.size_bound+1):
+			enc.encodeFormula(size)
+		enc_time_incr = time.time() - enc_time_incr
+		self.enc_time += enc_time_incr
+
+		formula, size, size_bound = None, self.size_bound, self.size_bound
+		while size_bound > 0:
+			enc.boundSize(size_bound)
+			solving_time_incr = time.time()
+			solverRes = enc.solver.solve()
+			solving_time_incr = time.time() - solving_time_incr
+			self.solving_time += solving_time_incr
+			self.size_solving_times.append(round(solving_time_incr,2))
+			if solverRes != True:
+				break
+
+			model = enc.solver.get_model()
+			size = enc.modelSize(model)
+			formula = enc.reconstructWholeFormula(model, size)
+			print('Found formula of size %d, bounding the search below it'%size)
+			size_bound = size - 1
+
+		if formula != None:
+			print("Found formula {} in time {}".format(formula.prettyPrint(), round(self.enc_time + self.solving_time,2)))
+		return formula, size
+
+	def size_portfolio(self, enc):
+		'''
+		Solves the sizes in size_workers processes at once, each forked with the encoding before any
+		size is encoded: process w solves the sizes w+1, w+1+size_workers, ... on its own copy, extending
+		it incrementally from one of its sizes to the next. The result is the smallest satisfiable size
+		once all smaller ones are proven unsatisfiable, the processes still running being terminated
+		then. Returns the formula, its size and the wall-clock time
+		'''
+		global _portfolio
+		wall_time = time.time()
+		formula, size = None, self.size_bound
+		self.size_encoding_times = []
+
+		_portfolio = (self, enc)
+		context = multiprocessing.get_context('fork')
+		answers = context.Queue()
+		workers = [context.Process(target=_portfolio_sizes, args=(range(first, self.size_bound+1, self.size_workers), answers))\
+					for first in range(1, min(self.size_workers, self.size_bound)+1)]
+		for worker in workers:
+			worker.start()
+		_portfolio = None
+
+		results = {}
+		try:
+			for size in range(1,self.size_bound+1):
+				while size not in results:
+					answer_size, result = _receive(answers, workers)
+					if isinstance(result, Exception):
+						raise Exception('Solving size %d failed: %s'%(answer_size, result))
+					results[answer_size] = result
+				formula, enc_time, solving_time, checking_time, cegis_iterations = results[size]
+				self.enc_time += enc_time
+				self.solving_time += solving_time
+				self.checking_time += checking_time
+				self.cegis_iterations += cegis_iterations
+				self.size_encoding_times.append(round(enc_time,2))
+				self.size_solving_times.append(round(solving_time,2))
+				print('Size %d took %.2f seconds'%(size, enc_time+solving_time))
+				if formula != None:
+					break
+		finally:
+			for worker in workers:
+				worker.terminate()
+				worker.join()
+
+		wall_time = round(self.enc_time_init + time.time() - wall_time,2)
+		if formula != None:
+			print("Found formula {} in time {}".format(formula.prettyPrint(), wall_time))
+		self.metadata.update({'Size Encoding Times': self.size_encoding_times})
+		return formula, size, wall_time
+
+	def solver_portfolio(self, neg_props=False):
+		'''
+		Races the solvers of the portfolio size by size: each one runs in a process of its own for the
+		whole search, extending its encoding incrementally to every size it is sent, and the first answer
+		for the current size is taken. A solver still busy with an earlier size skips to the latest one
+		sent once done. The solver answering first is recorded per size; the times are those of the winner
+		'''
+		context = multiprocessing.get_context('fork')
+		self.portfolio_winners = []
+		formula = None
+		answers = context.Queue()
+		commands = {solver_name: context.Queue() for solver_name in self.portfolio}
+		racers = {solver_name: context.Process(target=_race_sizes, args=(self, solver_name, neg_props, commands[solver_name], answers))\
+					for solver_name in self.portfolio}
+		for racer in racers.values():
+			racer.start()
+
+		errors = []
+		try:
+			for size in range(1,self.size_bound+1):
+				print('--- Racing %s on size %d ---'%(', '.join(racers), size))
+				for solver_name in racers:
+					commands[solver_name].put(size)
+				while True:
+					if racers == {}:
+						raise Exception('No solver of the portfolio answered: %s'%'; '.join('%s: %s'%error for error in errors))
+					solver_name, answer_size, answer = _receive(answers, list(racers.values()))
+					if isinstance(answer, Exception):
+						errors.append((solver_name, answer))
+						racers.pop(solver_name).join()
+					elif answer_size == size:
+						break
+
+				formula, enc_time, solving_time, checking_time, cegis_iterations = answer
+				self.enc_time += enc_time
+				self.solving_time += solving_time
+				self.checking_time += checking_time
+				self.cegis_iterations += cegis_iterations
+				self.size_solving_times.append(round(solving_time,2))
+				self.portfolio_winners.append(solver_name)
+				print('Size %d took %.2f seconds, answered by %s'%(size, enc_time+solving_time, solver_name))
+				if formula != None:
+					print("Found formula {} in time {}".format(formula.prettyPrint(), round(self.enc_time + self.solving_time + self.checking_time,2)))
+					break
+		finally:
+			for racer in racers.values():
+				racer.terminate()
+				racer.join()
+
+		self.metadata.update({'Portfolio Winners': self.portfolio_winners})
+		return formula, size
+
+	def enumerate_formulas(self, limit=None, neg_props=False):
+		'''
+		Yields the consistent formulas of minimal size, at most limit of them: once the minimal size is
+		found, the operators and children of every model are blocked on the same solver and solving is
+		repeated; formulas equal up to the order of commutative operands are yielded once
+		'''
+		enc = self.new_encoding(self.solver_name, neg_props)
+		formula = None
+		for size in range(1,self.size_bound+1):
+			enc.encodeFormula(size)
+			formula = self.solve_size(enc, size)
+			if formula != None:
+				break
+
+		found = set()
+		while formula != None and (limit == None or len(found) < limit):
+			if formula.canonicalForm() not in found:
+				found.add(formula.canonicalForm())
+				yield formula
+			enc.blockFormula(enc.solver.get_model(), size)
+			formula = self.solve_size(enc, size)
+
+	def learn_labels(self, neg_props=False):
+		'''
+		Multi-label mode: learns a formula for every labelling of the pooled structures (the sample file
+		and the label files) with one encoding, whose rows and structure semantics all labellings share;
+		every size is solved for each labelling without a formula yet, under the labelling's assumption
+		'''
+		label_names = [self.sample_file] + self.label_files
+		print('Learning %s formulas for %d labellings of %d structures'%(self.formula_type.upper(), len(label_names), self.sample.num_total))
+		enc_time_incr = time.time()
+		enc = self.new_encoding(self.solver_name, neg_props)
+		self.enc_time += time.time() - enc_time_incr
+
+		formulas = {}
+		label_solving_times = [0]*len(label_names)
+		for size in range(1,self.size_bound+1):
+			print('--- Preparing encoding for size %d ---'%size)
+			enc_time_incr = time.time()
+			enc.encodeFormula(size)
+			self.enc_time += time.time() - enc_time_incr
+
+			for label in range(len(label_names)):
+				if label in formulas:
+					continue
+				solving_time_incr = time.time()
+				solverRes = enc.solver.solve(enc.assumptions(size, label))
+				solving_time_incr = time.time() - solving_time_incr
+				self.solving_time += solving_time_incr
+				label_solving_times[label] += solving_time_incr
+				if solverRes == True:
+					formulas[label] = (enc.reconstructWholeFormula(enc.solver.get_model(), size), size)
+					print('Found formula %s for %s'%(formulas[label][0].prettyPrint(), label_names[label]))
+
+			if len(formulas) == len(label_names):
+				break
+
+		total_time = self.enc_time + self.solving_time
+		results = []
+		for label, label_name in enumerate(label_names):
+			formula, size = formulas.get(label, (None, None))
+			ver = None
+			if formula != None:
+				ver = consistency_checker(self.labelled_sample(label), formula, self.model_type, self.formula_type)
+				if not ver:
+					raise Exception('Incorrect Formula found for %s'%label_name)
+			results.append({'Labelling': label_name, 'Learned Formula': formula.prettyPrint() if formula != None else None,
+							'Learned Formula Size': size, 'Verification': ver, 'Solving Time': round(label_solving_times[label],2)})
+
+		self.metadata.update({'Encoding Time': round(self.enc_time,2), 'Solving Time': round(self.solving_time,2),
+							'Total Time': round(total_time,2), 'Labellings': results,
+							'Labellings per Second': round(len(label_names)/total_time,2) if total_time > 0 else None})
+		self.metadata.update(enc.stats)
+		if self.backend == 'cnf':
+			self.metadata.update(enc.solver.stats())
+		self.dump_json(self.json_file)
+
+		return [formulas[label][0] if label in formulas else None for label in range(len(label_names))]
+
+	def read_labellings(self, sample_class):
+		'''
+		Multi-label mode: pools the structures of the sample file and of the label files into self.sample
+		(as positive structures) and returns the labelling of every file as (positive ids, negative ids)
+		'''
+		samples = [self.sample]
+		for label_file in self.label_files:
+			sample = sample_class(positive=[], negative=[], propositions=[])
+			sample.read_sample(label_file)
+			samples.append(sample)
+		pool, labellings = structure_pool(samples)
+		self.sample = sample_class(positive=pool, negative=[], propositions=[])
+		if self.cgs:
+			self.sample.players = samples[0].players
+		self.sample.calc_stats()
+		return labellings
+
+	def labelled_sample(self, label):
+		'''The (unreduced) pooled structures as classified by a labelling'''
+		positives, negatives = self.labellings[label]
+		sample = type(self.sample)(positive=[self.sample.positive[structure_id] for structure_id in positives],\
+									negative=[self.sample.positive[structure_id] for structure_id in negatives], propositions=[])
+		sample.calc_stats()
+		return sample
+
+	def verify(self, formula):
+		'''
+		Checks the formula on the whole (unreduced) sample; with a noise budget the misclassified
+		structures (the sacrificed ones) are recorded and at most the budget of them is allowed
+		'''
+		if self.noise_budget == None:
+			return consistency_checker(self.sample, formula, self.model_type, self.formula_type)
+		misclassified = misclassified_structures(self.sample, formula, self.model_type, self.formula_type)
+		print('Misclassified structures', misclassified)
+		self.metadata.update({'Misclassified Structures': misclassified})
+		return len(misclassified) <= self.noise_budget
+
+	def new_encoding(self, solver_name, neg_props=False):
+		'''The encoding of the sample for the formula type, solved with the given solver'''
+		options = {'child_mux': self.child_mux, 'temporal_encoding': self.temporal_encoding, 'backend': self.backend,
+					'symmetry_breaking': self.symmetry_breaking, 'incremental': self.incremental,
+					'active_examples': self.initial_examples(), 'workers': self.workers,
+					'shared_states': self.shared_states, 'leaf_constants': self.leaf_constants,
+					'cardinality': self.cardinality, 'child_index': self.child_index,
+					'semantic_uniqueness': self.semantic_uniqueness, 'optimise': self.optimise,
+					'noise_budget': self.noise_budget, 'noise_solver': self.noise_solver, 'lazy_depth': self.lazy_depth,
+					'template': self.template_formula, 'labellings': self.labellings}
+		if self.formula_type == 'atl':
+			return ATLSATEncoding(self.encoded_sample, self.encoded_sample.propositions, self.operators, solver_name, self.turn, **options)
+		return CTLSATEncoding(self.encoded_sample, self.encoded_sample.propositions, self.operators, solver_name, neg_props=neg_props, **options)
+
+	def initial_examples(self):
+		'''The examples encoded from the start: all of them, or in CEGIS mode the first few of each class'''
+		if not self.cegis:
+			return None
+		return list(range(min(self.cegis_init, self.encoded_sample.num_positive))) +\
+				list(range(self.encoded_sample.num_positive, self.encoded_sample.num_positive + min(self.cegis_init, self.encoded_sample.num_negative)))
+
+	def solve_size(self, enc, size):
+		'''
+		Solves the encoding of the given size and returns the formula found, if any. In CEGIS mode the
+		candidate is model checked on the structures left out, the misclassified ones are added to the
+		encoding and solving is repeated; unsatisfiability on a subset implies it on the whole sample.
+		With a lazy unrolling depth a candidate misclassifying an encoded structure relied on fixpoints
+		unrolled short of convergence, which are then unrolled deeper before solving again
+		'''
+		size_solving_time = 0
+		while True:
+			solving_time_incr = time.time()
+			if self.noise_budget != None and self.noise_solver == 'maxsat':
+				sacrificed = enc.solver.solve_maxsat(enc.assumptions(size), enc.softLiterals())
+				solverRes = sacrificed != None and sacrificed <= self.noise_budget
+			else:
+				solverRes = enc.solver.solve(enc.assumptions(size))
+			solving_time_incr = time.time() - solving_time_incr
+			self.solving_time += solving_time_incr
+			size_solving_time += solving_time_incr
+			
+			formula = None
+			if solverRes == True:
+				formula = enc.reconstructWholeFormula(enc.solver.get_model(), size)
+			if formula == None or not (self.cegis or self.lazy_depth != None):
+				break
+
+			if self.lazy_depth != None:
+				checking_time_incr = time.time()
+				spurious = misclassified_structures(self.encoded_sample, formula, self.model_type, self.formula_type, sorted(enc.active))
+				self.checking_time += time.time() - checking_time_incr
+				if spurious != []:
+					structure_ids = enc.unconvergedStructures(enc.solver.get_model(), size)
+					if structure_ids == []:
+						raise Exception('Misclassified structures with converged fixpoints')
+					print('Unrolling the fixpoints deeper on %d structures'%len(structure_ids))
+					enc_time_incr = time.time()
+					enc.refineDepth(structure_ids, size)
+					self.enc_time += time.time() - enc_time_incr
+					continue
+				if not self.cegis:
+					break
+
+			checking_time_incr = time.time()
+			misclassified = misclassified_structures(self.encoded_sample, formula, self.model_type, self.formula_type,\
+											[structure_id for structure_id in range(self.encoded_sample.num_total) if structure_id not in enc.active])
+			self.checking_time += time.time() - checking_time_incr
+			if misclassified == []:
+				break
+
+			self.cegis_iterations += 1
+			print('Adding %d misclassified structures'%len(misclassified))
+			enc_time_incr = time.time()
+			enc.addExamples(misclassified, size)
+			self.enc_time += time.time() - enc_time_incr
+
+		self.size_solving_times.append(round(size_solving_time,2))
+		return formula
+
+	def cnf_file(self, size):
+		sample_name = os.path.basename(self.sample_file).split('.')[0]
+		return os.path.join(self.dump_cnf, '%s-size%d.cnf'%(sample_name, size))
+
 	def dump_json(self, json_file='metadata.json'):
 		with open(json_file, 'w') as f:
 			json.dump(self.metadata, f, indent=4)
 
 
+# the framework and fresh encoding the processes of the size portfolio inherit from the parent
+_portfolio = None
+
+
+def _portfolio_sizes(sizes, answers):
+	'''Solves the given sizes in increasing order on one encoding, up to the first satisfiable one'''
+	learn, enc = _portfolio
+	encoded = 0
+	for size in sizes:
+		try:
+			result = _encode_and_solve(learn, enc, size, encoded+1)
+		except Exception as error:
+			answers.put((size, error))
+			return
+		encoded = size
+		answers.put((size, result))
+		if result[0] != None:
+			return
+
+
+def _receive(answers, processes, timeout=1):
+	'''
+	The next answer of the processes; raises instead of blocking for good once they have all
+	exited, e.g. killed by the system, without answering
+	'''
+	while True:
+		alive = any(process.is_alive() for process in processes)
+		try:
+			return answers.get(timeout=timeout)
+		except queue.Empty:
+			if not alive:
+				raise Exception('The processes exited without answering (exit codes %s)'%\
+								', '.join(str(process.exitcode) for process in processes))
+
+
+def _race_sizes(learn, solver_name, neg_props, commands, answers):
+	'''Solves the sizes sent on commands with one encoding, skipping to the latest size sent'''
+	encoded = 0
+	try:
+		enc = learn.new_encoding(solver_name, neg_props)
+		while True:
+			size = commands.get()
+			try:
+				while True:
+					size = commands.get_nowait()
+			except queue.Empty:
+				pass
+			answers.put((solver_name, size, _encode_and_solve(learn, enc, size, encoded+1)))
+			encoded = size
+	except Exception as error:
+		answers.put((solver_name, encoded+1, error))
+
+
+def _encode_and_solve(learn, enc, size, first=1):
+	'''Encodes the sizes first..size and solves size, returning the formula and the time increments'''
+	enc_time_cegis, checking_time, cegis_iterations = learn.enc_time, learn.checking_time, learn.cegis_iterations
+
+	enc_time = time.time()
+	for formula_size in range(first,size+1):
+		enc.encodeFormula(formula_size)
+	enc_time = time.time() - enc_time
+	if learn.dump_cnf != None:
+		enc.solver.dump(learn.cnf_file(size), enc.assumptions(size))
+
+	formula = learn.solve_size(enc, size)
+	return formula, enc_time + learn.enc_time - enc_time_cegis, learn.size_solving_times[-1],\
+			learn.checking_time - checking_time, learn.cegis_iterations - cegis_iterations
+
+
+def installed_solvers():
+	'''The pysmt solvers installed for propositional logic'''
+	return sorted(get_env().factory.all_solvers(logic=QF_BOOL))
+
+
 def main():
 
 	parser = argparse.ArgumentParser(description='Parameters for the learning algo')
@@ -196,6 +735,33 @@ def main():
 	#Learning optimizations
 	parser.add_argument('-n', '--neg_props', action='store_true', default=False, help='Negation optimization')
 	parser.add_argument('-w', '--without_until', action='store_true', default=False, help='Without Until operator')
+	parser.add_argument('--mux', action='store_true', default=False, help='Child multiplexing optimization')
+	parser.add_argument('--temporal', default='unroll', choices=['unroll', 'rank'], help='Encoding of the temporal fixpoints')
+	parser.add_argument('--symmetry', nargs='*', default=[], choices=symmetry_rules, help='Symmetry breaking rules for the syntax DAG')
+	parser.add_argument('--incremental', default='assume', choices=['assume', 'push'], help='Retain the solver across sizes through assumptions, or scope each size with push/pop')
+	parser.add_argument('--cegis', action='store_true', default=False, help='Encode the structures lazily, as counterexamples to the candidate formulas')
+	parser.add_argument('--cegis_init', default=1, type=int, help='Number of positive and of negative structures encoded from the start in CEGIS mode')
+	parser.add_argument('--workers', default=1, type=int, help='Number of processes building the per-structure constraints (cnf backend only)')
+	parser.add_argument('--keep_unreachable', action='store_true', default=False, help='Do not remove the states unreachable from the initial states')
+	parser.add_argument('--keep_bisimilar', action='store_true', default=False, help='Do not merge (alternating) bisimilar states before encoding')
+	parser.add_argument('--share_states', action='store_true', default=False, help='Identify bisimilar states across structures and encode them once')
+	parser.add_argument('--leaf_constants', action='store_true', default=False, help='Substitute the labels for the values of leaf rows instead of constraining them')
+	parser.add_argument('--cardinality', default='pairwise', choices=cardinality_encodings, help='Encoding of the one-hot operator and child selectors of the rows')
+	parser.add_argument('--child_index', default='onehot', choices=['onehot', 'binary'], help='Encoding of the child indices of the rows')
+	parser.add_argument('--unique_rows', action='store_true', default=False, help='Require every row to differ from the earlier rows at some state of the sample')
+	parser.add_argument('--optimise', action='store_true', default=False, help='Encode all sizes up to the bound at once and search the minimal one on the same solver')
+	parser.add_argument('--size_workers', default=1, type=int, help='Number of processes solving consecutive formula sizes at once')
+	parser.add_argument('--portfolio', nargs='*', default=None, help='Race these solvers (all installed pysmt solvers if none is named) on every size')
+	parser.add_argument('--enumerate', default=None, type=int, help='Print up to this many distinct formulas of minimal size')
+	parser.add_argument('--noise', default=0, type=float, help='Fraction of the structures the formula may misclassify')
+	parser.add_argument('--noise_solver', default='cardinality', choices=['cardinality', 'maxsat'], help='Bound the misclassified structures with a cardinality constraint, or minimise them with MaxSAT (cnf backend)')
+	parser.add_argument('--template', default=None, help='Learn a formula of this shape, only searching the subformulas filling its holes (?)')
+	parser.add_argument('--lazy_depth', default=None, type=int, help='Unroll the fixpoints to this depth first, deepening it where candidates need it')
+	parser.add_argument('--labels', nargs='+', default=None, help='Further sample files labelling the structures of the input file; learns one formula per labelling')
+	#SAT backend
+	parser.add_argument('--backend', default='pysmt', choices=['pysmt', 'cnf'], help='Solve through pysmt or through the native CNF encoding')
+	parser.add_argument('--sat_solver', default='cadical153', help='SAT solver of the cnf backend: a python-sat solver name or a DIMACS solver binary')
+	parser.add_argument('--dump_cnf', default=None, help='Folder to write the CNF of every size to (cnf backend)')
 	
 	args = parser.parse_args()
 
@@ -214,11 +780,28 @@ def main():
 			args.operators = [op for op in ctl_operators if op != 'AU' and op != 'EU']
 	
 
+	solver_name = args.sat_solver if args.backend == 'cnf' else args.solver
+
 	learn = LearnFramework(sample_file=args.input_file, size_bound=args.formula_size,\
-							operators=args.operators, solver_name=args.solver, \
-							cgs=args.game, atl=args.atl, turn=args.turn)
+							operators=args.operators, solver_name=solver_name, \
+							cgs=args.game, atl=args.atl, turn=args.turn, child_mux=args.mux,\
+							temporal_encoding=args.temporal, backend=args.backend, dump_cnf=args.dump_cnf,\
+							symmetry_breaking=args.symmetry, incremental=args.incremental,\
+							cegis=args.cegis, cegis_init=args.cegis_init, workers=args.workers,\
+							prune_unreachable=not args.keep_unreachable, reduce_structures=not args.keep_bisimilar,\
+							shared_states=args.share_states, leaf_constants=args.leaf_constants,\
+							cardinality=args.cardinality, child_index=args.child_index,\
+							semantic_uniqueness=args.unique_rows, optimise=args.optimise, size_workers=args.size_workers,\
+							portfolio=args.portfolio, noise=args.noise, noise_solver=args.noise_solver,\
+							lazy_depth=args.lazy_depth, template=args.template, label_files=args.labels)
 	
-	if args.atl:
+	if args.labels != None:
+		for formula in learn.learn_labels():
+			print(formula.prettyPrint() if formula != None else None)
+	elif args.enumerate != None:
+		for formula in learn.enumerate_formulas(args.enumerate):
+			print(formula.prettyPrint())
+	elif args.atl:
 		learn.learn_atl()
 	else:
 		learn.learn_ctl()
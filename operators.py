@@ -10,4 +10,19 @@ atl_boolean = ['&', '|', '->', '!']
 atl_temporal = ['G', 'F', 'X', 'U']
 atl_unary = ['G', 'F', 'X','!']
 atl_binary = ['&', '|', '->', 'U']
-atl_operators = atl_unary + atl_binary
\ No newline at end of file
+atl_operators = atl_unary + atl_binary
+
+# operators whose operands may be swapped, and operators op with op(op(f)) = op(f)
+ctl_commutative = ['&', '|']
+ctl_idempotent = ['EF', 'AF', 'EG', 'AG']
+atl_commutative = ['&', '|']
+atl_idempotent = ['F', 'G']
+
+# temporal operators defined as fixpoints, and which of them are greatest fixpoints
+ctl_fixpoints = ['EG', 'AG', 'EF', 'AF', 'EU', 'AU']
+ctl_greatest = ['EG', 'AG']
+atl_fixpoints = ['G', 'F', 'U']
+atl_greatest = ['G']
+
+# symmetry breaking rules for the syntax DAG search
+symmetry_rules = ['commutative', 'leaves', 'redundancy']
@@ -0,0 +1,110 @@
+'''
+Parallel construction of the per-structure semantic constraints of a row.
+
+The semantics of a row on different structures are independent, so the structures are split
+into chunks that forked worker processes encode: each worker states the constraints of its
+chunk with a copy of the encoding whose solver is a clause-collecting CNFSolver, and sends the
+resulting integer clauses back, pysmt formulas not being picklable across processes. The parent
+merges the clauses into its own solver, renumbering the Tseitin variables of every chunk.
+
+The pool is forked once per encoding and kept for the later rows: a worker's copy of the
+encoding only has the variables of the rows encoded before the fork, so it creates those of
+the later rows (and of deeper unrollings) itself, under the same names as the parent.
+'''
+
+import os
+import weakref
+import multiprocessing
+from pysmt.shortcuts import Symbol, And, Or, Not, TRUE
+from cnf_solver import CNFSolver
+
+
+# the encoding the forked workers inherit from the parent
+_encoding = None
+
+# (row, structure id) -> unrolling depth of the semantic variables created by the worker
+_variables = {}
+
+
+def _encode_chunk(args):
+	formula_size, structure_ids, unroll = args
+	enc = _encoding
+	enc.solver = CNFSolver(None)
+	enc.unroll.update(unroll)
+	stats = dict(enc.stats)
+	converged = set(enc.converged)
+
+	structures = enc.activeStructures(structure_ids)
+	for size in range(1, formula_size+1):
+		enc.rowVariables(size)
+		missing = [(structure_id, structure) for structure_id, structure in structures\
+					if _variables.get((size, structure_id)) != enc.unroll[structure_id]]
+		enc.structureVariables(size, missing)
+		_variables.update({(size, structure_id): enc.unroll[structure_id] for structure_id, _ in missing})
+
+	enc.propositionsSemantics(formula_size, structures)
+	enc.operatorsSemantics(formula_size, structures)
+
+	var_names = {var: symbol.symbol_name() for symbol, var in enc.solver.symbol_vars.items()}
+	stats = {key: enc.stats[key] - stats[key] for key in stats}
+	# the convergence variables of the truncated fixpoints (lazy unrolling), by name
+	converged = {key: symbol.symbol_name() for key, symbol in enc.converged.items() if key not in converged}
+	return enc.solver.clauses, var_names, enc.solver.true_var, enc.solver.num_vars, stats, converged
+
+
+def worker_pool(enc, workers):
+	'''
+	The pool of workers of enc, forked on first use; a process forked from the owner of the
+	pool (e.g. by the size portfolio) forks a pool of its own
+	'''
+	global _encoding
+	if enc.worker_pool is None or enc.worker_pool[0] != os.getpid():
+		_encoding = enc
+		pool = multiprocessing.get_context('fork').Pool(workers)
+		_encoding = None
+		weakref.finalize(enc, pool.terminate)
+		enc.worker_pool = (os.getpid(), pool)
+	return enc.worker_pool[1]
+
+
+def parallel_semantics(enc, formula_size, structures, workers):
+	'''
+	States the semantics of row formula_size-1 on the given structures, built by the pool of
+	workers of enc; the clauses are added to enc.solver, the statistics to enc.stats and the
+	convergence variables of the truncated fixpoints to enc.converged
+	'''
+	structure_ids = [structure_id for structure_id, _ in structures]
+	chunks = [structure_ids[pos::workers] for pos in range(workers) if structure_ids[pos::workers] != []]
+
+	pool = worker_pool(enc, workers)
+	blocks = pool.map(_encode_chunk, [(formula_size, chunk, {structure_id: enc.unroll[structure_id] for structure_id in chunk})\
+										for chunk in chunks])
+
+	for chunk, (clauses, var_names, true_var, num_vars, stats, converged) in zip(chunks, blocks):
+		merge_clauses(enc.solver, clauses, var_names, true_var, num_vars, 'ts_%d_%d'%(formula_size - 1, chunk[0]))
+		for key in stats:
+			enc.stats[key] += stats[key]
+		enc.converged.update({key: Symbol(name) for key, name in converged.items()})
+
+
+def merge_clauses(solver, clauses, var_names, true_var, num_vars, prefix):
+	'''
+	Adds clauses built by a worker to a CNFSolver directly, or to a pysmt solver as disjunctions,
+	with the worker's Tseitin variables named after the (unique) prefix
+	'''
+	if isinstance(solver, CNFSolver):
+		solver.add_clauses(clauses, var_names, true_var, num_vars)
+		return
+
+	# pysmt formula of every (signed) integer literal, built once
+	literals = {var: Symbol(name) for var, name in var_names.items()}
+	literals[true_var] = TRUE()
+	def literal(lit):
+		if abs(lit) not in literals:
+			literals[abs(lit)] = Symbol('%s_%d'%(prefix, abs(lit)))
+		if lit not in literals:
+			literals[lit] = Not(literals[-lit])
+		return literals[lit]
+
+	# one assertion for all clauses, the per-assertion overhead of pysmt dominating otherwise
+	solver.add_assertion(And([Or([literal(lit) for lit in clause]) for clause in clauses]))
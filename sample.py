@@ -19,6 +19,42 @@ def consistency_checker(sample, formula, model_type='kripke', formula_type='ctl'
 			return False
 	return True
 
+def misclassified_structures(sample, formula, model_type='kripke', formula_type='ctl', structure_ids=None):
+	'''
+	ids (positives first, then negatives) of the structures, among structure_ids if given, that
+	the formula does not classify correctly
+	'''
+	structures = sample.positive + sample.negative
+	if structure_ids is None:
+		structure_ids = range(len(structures))
+	misclassified = []
+	for structure_id in structure_ids:
+		checker = ModelChecker(model=structures[structure_id], formula=formula, model_type=model_type, formula_type=formula_type)
+		if checker.check() != (structure_id < len(sample.positive)):
+			misclassified.append(structure_id)
+	return misclassified
+
+def structure_pool(samples):
+	'''
+	The distinct structures of samples labelling (partly) the same structures, and for every sample
+	the ids of its positive and of its negative structures in that pool; structures are identified by
+	their text
+	'''
+	pool = []
+	pool_ids = {}
+	labellings = []
+	for sample in samples:
+		labelling = ([], [])
+		for structures, structure_ids in [(sample.positive, labelling[0]), (sample.negative, labelling[1])]:
+			for structure in structures:
+				text = structure.to_string()
+				if text not in pool_ids:
+					pool_ids[text] = len(pool)
+					pool.append(structure)
+				structure_ids.append(pool_ids[text])
+		labellings.append(labelling)
+	return pool, labellings
+
 class Sample:
 	'''
 	contains the sample of postive and negative examples
@@ -43,6 +79,29 @@ class Sample:
 	def read_sample(self):
 		pass
 
+	def shared_structures(self):
+		'''
+		The structures merged into one state space in which bisimilar states, also of different
+		structures, are identified, split into connected components. Returns the components and,
+		for every structure of the sample, its initial states as (component, state) pairs.
+		'''
+		union, offsets = self.union()
+		block = union.bisimulation_classes()
+		quotient = union.bisimulation_quotient(block)
+		components = connected_components(quotient.states, quotient.successors)
+		component_of = {state: component_id for component_id, component in enumerate(components) for state in component}
+		structures = [quotient.substructure(component, quotient.init_states & component) for component in components]
+		init_states = [sorted(set((component_of[block[offset + state]], block[offset + state]) for state in structure.init_states))\
+						for structure, offset in zip(self.positive + self.negative, offsets)]
+		return structures, init_states
+
+	def restrict_to_reachable(self):
+		'''
+		Restricts every structure to the states reachable from its initial states, which are the only
+		ones the satisfaction at the initial states depends on; returns the number of states removed
+		'''
+		return sum(structure.restrict_to_reachable() for structure in self.positive + self.negative)
+
 
 class SampleKripke(Sample):
 	'''
@@ -84,6 +143,17 @@ class SampleKripke(Sample):
 			
 			self.calc_stats()
 
+	def union(self):
+		return union_kripkes(self.positive + self.negative)
+
+	def bisimulation_quotient(self):
+		'''Sample of the bisimulation quotients of the structures, which CTL does not tell apart from them'''
+		sample = SampleKripke(positive=[kripke.bisimulation_quotient() for kripke in self.positive],\
+							negative=[kripke.bisimulation_quotient() for kripke in self.negative],\
+							propositions=self.propositions, formula=self.formula)
+		sample.calc_stats()
+		return sample
+
 	def generate_random(self, 
 					 file_path, 
 					 total_num_positive=10, 
@@ -336,6 +406,18 @@ class SampleCGS(Sample):
 			self.calc_stats()
 			self.write(file_path)
 
+	def union(self):
+		return union_cgss(self.positive + self.negative)
+
+	def bisimulation_quotient(self):
+		'''Sample of the alternating bisimulation quotients of the structures, which ATL does not tell apart from them'''
+		sample = SampleCGS(positive=[cgs.bisimulation_quotient() for cgs in self.positive],\
+						negative=[cgs.bisimulation_quotient() for cgs in self.negative],\
+						propositions=self.propositions, formula=self.formula)
+		sample.players = self.players
+		sample.calc_stats()
+		return sample
+
 	def generate_random(self, 
 					 file_path, 
 					 total_num_positive=10, 
@@ -1,10 +1,14 @@
 import os
-from formulas import CTLFormula
+import json
+import shutil
+import pytest
+from formulas import CTLFormula, ATLFormula
 from graph_structures import Kripke, ConcurrentGameStructure
-from sample import SampleKripke
+from sample import SampleKripke, consistency_checker
 from std_modelcheck import *
 from operators import *
 from learn_formulas import LearnFramework
+from cardinality import cardinality_encodings
 
 # Testing formula classes
 def test_ctl_formulas():
@@ -147,3 +151,280 @@ def test_cgs():
 	assert(c.init_states == {0})
 	assert(c.propositions == {'o', 'i', 'r','g'})
 	
+
+def test_fixpoint_emission():
+
+	for name in [('sample_EG.sp', 'EG(p)'), ('sample_EF.sp', 'EF(p)'), ('sample_EU.sp', 'EU(p,q)')]:
+		sample_path = os.path.join(os.path.dirname(__file__), 'inputs', name[0])
+		learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators)
+		learned_formula = learn.learn_ctl()
+		assert consistency_checker(learn.sample, learned_formula, 'kripke', 'ctl')
+		assert learned_formula.getNumberOfSubformulas() == CTLFormula.convertTextToFormula(name[1]).getNumberOfSubformulas()
+		assert learn.metadata['Fixpoint Constraints'] > 0
+		assert learn.metadata['Fixpoint Constraints Saved (Estimate)'] == learn.metadata['Fixpoint Constraints']*(learn.encoded_sample.num_total-1)
+
+# samples the encoding options are learned on: (sample file, formula type, formula); the cgs samples
+# are f:01-nm:005-sm:003 and f:02-nm:005-sm:003 of test_suite/second_suite_ATL
+option_samples = [('sample_EX.sp', 'ctl', 'EX(p)'), ('sample_EG.sp', 'ctl', 'EG(p)'), ('sample_EF.sp', 'ctl', 'EF(p)'),\
+					('sample_EU.sp', 'ctl', 'EU(p,q)'), ('sample_cgs_X.sp', 'atl', '<1>X(p)'), ('sample_cgs_F.sp', 'atl', '<0>F(p)')]
+
+# options that leave the minimal size of the learned formulas unchanged
+encoding_options = [{'child_mux': True},
+					{'temporal_encoding': 'rank'},
+					{'temporal_encoding': 'rank', 'child_mux': True},
+					{'backend': 'cnf', 'solver_name': 'cadical153'},
+					*[{'symmetry_breaking': rules} for rules in [[rule] for rule in symmetry_rules] + [symmetry_rules]],
+					{'reduce_structures': False},
+					{'shared_states': True},
+					{'leaf_constants': True},
+					*[{'cardinality': cardinality} for cardinality in cardinality_encodings],
+					{'child_index': 'binary'},
+					{'semantic_uniqueness': True},
+					{'optimise': True, 'symmetry_breaking': symmetry_rules, 'semantic_uniqueness': True}]
+
+@pytest.mark.parametrize('options', encoding_options)
+@pytest.mark.parametrize('sample_file, formula_type, formula', option_samples)
+def test_encoding_options(sample_file, formula_type, formula, options, tmp_path):
+
+	sample_path = os.path.join(os.path.dirname(__file__), 'inputs', sample_file)
+	if formula_type == 'atl':
+		# reading a cgs sample writes it back, so it is learned from a copy
+		sample_path = shutil.copy(sample_path, tmp_path)
+		learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=atl_operators, cgs=True, atl=True, **options)
+		learned_formula = learn.learn_atl()
+		original_formula = ATLFormula.convertTextToFormula(formula)
+	else:
+		learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators, **options)
+		learned_formula = learn.learn_ctl()
+		original_formula = CTLFormula.convertTextToFormula(formula)
+	assert consistency_checker(learn.sample, learned_formula, learn.model_type, formula_type)
+	assert learned_formula.getNumberOfSubformulas() == original_formula.getNumberOfSubformulas()
+
+def test_fixpoint_bounds():
+
+	for structure_file, bounds in [('example_kripke1.str', (2, 2)), ('example_kripke2.str', (4, 4))]:
+		kripke = Kripke(init_states=set(), transitions={}, labels={}, propositions=set())
+		structure_path = os.path.join(os.path.dirname(__file__), 'inputs', structure_file)
+		kripke.read_structure_file(structure_path)
+		assert (kripke.fixpoint_bound(), kripke.reachability_bound()) == bounds
+
+	for name in [('sample_EG.sp', 'EG(p)'), ('sample_EF.sp', 'EF(p)'), ('sample_EU.sp', 'EU(p,q)')]:
+		sample_path = os.path.join(os.path.dirname(__file__), 'inputs', name[0])
+		learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators)
+		learned_formula = learn.learn_ctl()
+		assert consistency_checker(learn.sample, learned_formula, 'kripke', 'ctl')
+		assert learned_formula.getNumberOfSubformulas() == CTLFormula.convertTextToFormula(name[1]).getNumberOfSubformulas()
+		assert learn.metadata['Unrolling Depth'] <= sum(structure.size for structure in learn.sample.positive + learn.sample.negative)
+
+	# p holds along a path into a state without successors, where EG(p) fails in the first iteration
+	sample_path = os.path.join(os.path.dirname(__file__), 'inputs', 'sample_deadlock.sp')
+	for options in [{}, {'reduce_structures': False, 'prune_unreachable': False}]:
+		learn = LearnFramework(sample_file=sample_path, size_bound=2, operators=ctl_operators, template='EG(p)', **options)
+		assert [(kripke.fixpoint_bound(), kripke.reachability_bound()) for kripke in learn.sample.positive] == [(2, 1)]
+		assert learn.learn_ctl() == None
+		learn = LearnFramework(sample_file=sample_path, size_bound=2, operators=ctl_operators, **options)
+		assert learn.learn_ctl().prettyPrint() == CTLFormula.convertTextToFormula('p').prettyPrint()
+
+def test_incremental_modes():
+
+	for name in [('sample_EX.sp', 'EX(p)'), ('sample_EG.sp', 'EG(p)'), ('sample_EF.sp', 'EF(p)'), ('sample_EU.sp', 'EU(p,q)')]:
+		sample_path = os.path.join(os.path.dirname(__file__), 'inputs', name[0])
+		for backend, solver_name in [('pysmt', 'z3'), ('cnf', 'cadical153')]:
+			learned_sizes = []
+			json_files = []
+			for incremental in ['assume', 'push']:
+				learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators, backend=backend,\
+										solver_name=solver_name, incremental=incremental)
+				learned_formula = learn.learn_ctl()
+				assert consistency_checker(learn.sample, learned_formula, 'kripke', 'ctl')
+				learned_sizes.append(learned_formula.getNumberOfSubformulas())
+				json_files.append(learn.json_file)
+			assert learned_sizes == [CTLFormula.convertTextToFormula(name[1]).getNumberOfSubformulas()]*2
+
+			# both runs keep their per-size times
+			for incremental, json_file in zip(['assume', 'push'], json_files):
+				with open(json_file) as f:
+					metadata = json.load(f)
+				assert metadata['Incremental Solving'] == incremental
+				assert len(metadata['Size Solving Times']) == learned_sizes[0]
+
+def test_cegis():
+
+	for name in [('sample_EX.sp', 'EX(p)'), ('sample_EG.sp', 'EG(p)'), ('sample_EF.sp', 'EF(p)'), ('sample_EU.sp', 'EU(p,q)')]:
+		sample_path = os.path.join(os.path.dirname(__file__), 'inputs', name[0])
+		learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators, cegis=True)
+		learned_formula = learn.learn_ctl()
+		assert consistency_checker(learn.sample, learned_formula, 'kripke', 'ctl')
+		assert learned_formula.getNumberOfSubformulas() == CTLFormula.convertTextToFormula(name[1]).getNumberOfSubformulas()
+		assert learn.metadata['CEGIS Structures'] <= learn.sample.num_total
+
+def test_parallel_learning():
+
+	sample_path = os.path.join(os.path.dirname(__file__), 'inputs', 'sample_EU.sp')
+	original_formula = CTLFormula.convertTextToFormula('EU(p,q)')
+
+	learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators, solver_name='cadical153',\
+							backend='cnf', workers=2)
+	learned_formula = learn.learn_ctl()
+	assert learned_formula.prettyPrint() == original_formula.prettyPrint()
+
+	with pytest.raises(Exception, match='require the cnf backend'):
+		LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators, workers=2)
+
+def test_reachability_pruning():
+
+	kripke = Kripke(init_states=set(), transitions={}, labels={}, propositions=set())
+	structure_path = os.path.join(os.path.dirname(__file__), 'inputs', 'example_kripke1.str')
+	kripke.read_structure_file(structure_path)
+
+	assert(kripke.restrict_to_reachable() == 3)
+	assert(kripke.states == {0})
+	assert(kripke.transitions == {0: {0}})
+	assert(kripke.propositions == {'p', 'q'})
+	assert(kripke.size == 1)
+
+def test_bisimulation_quotient():
+
+	kripke = Kripke(init_states=set(), transitions={}, labels={}, propositions=set())
+	kripke.read_structure('0\n---\n0:p\n1:p\n2:p\n3:q\n4:q\n---\n0,1\n0,3\n1,2\n1,3\n2,0\n2,4\n3,3\n4,3\n')
+	quotient = kripke.bisimulation_quotient()
+
+	assert(quotient.size == 2)
+	assert(len(quotient.init_states) == 1)
+	for formula_str in ['EG(p)', 'AG(p)', 'EX(q)', 'AF(q)', 'EU(p,q)', 'AX(EX(q))']:
+		formula = CTLFormula.convertTextToFormula(formula_str)
+		assert ModelChecker(model=kripke, formula=formula).check() == ModelChecker(model=quotient, formula=formula).check()
+
+def test_alternating_bisimulation_quotient(tmp_path):
+
+	c = ConcurrentGameStructure(init_states=set(), transitions={}, labels={}, players=[], propositions=set())
+	c.read_structure('0\n---\n0:p:0\n1:p:1\n2:p:1\n3:q:0\n---\n0,1:0,0\n0,2:1,0\n1,3:0,0\n2,3:0,0\n3,3:0,0\n---\n0,1\n')
+	quotient = c.bisimulation_quotient()
+
+	assert(quotient.size == 3)
+	assert(quotient.players == [0,1])
+	for formula_str in ['<0>X(p)', '<1>X(q)', '<1>F(q)', '<01>G(p)', '<0>U(p,q)']:
+		formula = ATLFormula.convertTextToFormula(formula_str)
+		assert ModelChecker(model=c, formula=formula, model_type='cgs', formula_type='atl').check() ==\
+				ModelChecker(model=quotient, formula=formula, model_type='cgs', formula_type='atl').check()
+
+	# one of the structures of this sample has bisimilar states; reading it writes it back, so a copy is read
+	sample_path = shutil.copy(os.path.join(os.path.dirname(__file__), 'inputs', 'sample_cgs_F.sp'), tmp_path)
+	learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=atl_operators, cgs=True, atl=True)
+	learned_formula = learn.learn_atl()
+	assert learn.metadata['Encoded States'] < learn.metadata['States']
+	assert consistency_checker(learn.sample, learned_formula, 'cgs', 'atl')
+	assert learned_formula.getNumberOfSubformulas() == ATLFormula.convertTextToFormula('<0>F(p)').getNumberOfSubformulas()
+
+def test_shared_states():
+
+	sample = SampleKripke(positive=[], negative=[], propositions=[])
+	sample_path = os.path.join(os.path.dirname(__file__), 'inputs', 'sample_EU.sp')
+	sample.read_sample(sample_path)
+	sample.positive.append(sample.positive[0])
+	sample.calc_stats()
+
+	structures, init_states = sample.shared_structures()
+	assert(sum(structure.size for structure in structures) <= sum(structure.size for structure in sample.positive[:-1] + sample.negative))
+	assert(init_states[0] == init_states[sample.num_positive-1])
+
+	learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators, shared_states=True)
+	learned_formula = learn.learn_ctl()
+	assert learned_formula.prettyPrint() == CTLFormula.convertTextToFormula('EU(p,q)').prettyPrint()
+
+def test_size_portfolio():
+
+	for name in [('sample_EX.sp', 'EX(p)'), ('sample_EU.sp', 'EU(p,q)')]:
+		sample_path = os.path.join(os.path.dirname(__file__), 'inputs', name[0])
+		learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators, size_workers=2)
+		learned_formula = learn.learn_ctl()
+		assert learned_formula.prettyPrint() == CTLFormula.convertTextToFormula(name[1]).prettyPrint()
+		assert len(learn.metadata['Size Solving Times']) == learned_formula.getNumberOfSubformulas()
+
+def test_solver_portfolio():
+
+	sample_path = os.path.join(os.path.dirname(__file__), 'inputs', 'sample_EU.sp')
+	for backend, portfolio in [('pysmt', []), ('cnf', ['cadical153', 'minisat22'])]:
+		learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators, backend=backend, portfolio=portfolio)
+		learned_formula = learn.learn_ctl()
+		assert learned_formula.prettyPrint() == CTLFormula.convertTextToFormula('EU(p,q)').prettyPrint()
+		assert all(winner in learn.portfolio for winner in learn.metadata['Portfolio Winners'])
+
+def test_portfolio_failures():
+
+	sample_path = os.path.join(os.path.dirname(__file__), 'inputs', 'sample_EU.sp')
+	for backend in ['pysmt', 'cnf']:
+		learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators, backend=backend, portfolio=['no_such_solver'])
+		with pytest.raises(Exception, match='No solver of the portfolio answered'):
+			learn.learn_ctl()
+
+def test_enumeration():
+
+	sample_path = os.path.join(os.path.dirname(__file__), 'inputs', 'sample_EU.sp')
+	learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators)
+	formulas = list(learn.enumerate_formulas(limit=10))
+	assert CTLFormula.convertTextToFormula('EU(p,q)').canonicalForm() in [formula.canonicalForm() for formula in formulas]
+	assert len(set(formula.canonicalForm() for formula in formulas)) == len(formulas)
+	for formula in formulas:
+		assert formula.getNumberOfSubformulas() == 3
+		assert consistency_checker(learn.sample, formula, 'kripke', 'ctl')
+
+def test_noise_tolerance():
+
+	# sample_EU.sp with its last negative structure added as a positive one
+	sample_path = os.path.join(os.path.dirname(__file__), 'inputs', 'sample_EU_noisy.sp')
+	for backend, solver_name, noise_solver in [('pysmt', 'z3', 'cardinality'), ('cnf', 'cadical153', 'maxsat')]:
+		learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators, solver_name=solver_name,\
+								backend=backend, noise=0.2, noise_solver=noise_solver)
+		learned_formula = learn.learn_ctl()
+		# several formulas of the minimal size may misclassify different structures within the budget
+		assert learned_formula.getNumberOfSubformulas() <= CTLFormula.convertTextToFormula('EU(p,q)').getNumberOfSubformulas()
+		assert len(learn.metadata['Misclassified Structures']) <= learn.noise_budget
+		assert learn.metadata['Verification'] == True
+
+def test_no_formula():
+
+	# the smallest formula consistent with sample_EU.sp has size 3
+	sample_path = os.path.join(os.path.dirname(__file__), 'inputs', 'sample_EU.sp')
+	for options in [{}, {'optimise': True}, {'size_workers': 2}, {'portfolio': []}, {'noise': 0.1}]:
+		learn = LearnFramework(sample_file=sample_path, size_bound=2, operators=ctl_operators, **options)
+		assert learn.learn_ctl() == None
+		assert learn.metadata['Learned Formula'] == None
+		assert learn.metadata['Learned Formula Size'] == None
+		assert learn.metadata['Verification'] == None
+
+def test_lazy_unrolling():
+
+	name_list = [('sample_EG.sp', 'EG(p)'), ('sample_EF.sp', 'EF(p)'), ('sample_EU.sp', 'EU(p,q)')]
+
+	for name in name_list:
+		sample_path = os.path.join(os.path.dirname(__file__), 'inputs', name[0])
+		for child_mux, backend, solver_name, workers in [(False, 'pysmt', 'z3', 1), (True, 'pysmt', 'z3', 1), (False, 'cnf', 'cadical153', 2)]:
+			learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators, child_mux=child_mux,\
+									backend=backend, solver_name=solver_name, workers=workers, lazy_depth=1)
+			learned_formula = learn.learn_ctl()
+			assert learned_formula.prettyPrint() == CTLFormula.convertTextToFormula(name[1]).prettyPrint()
+			assert learn.metadata['Unrolled Depth'] <= learn.metadata['Unrolling Depth']
+
+def test_template():
+
+	sample_path = os.path.join(os.path.dirname(__file__), 'inputs', 'sample_EU.sp')
+	for template, formula, hole_size in [('EU(?,q)', 'EU(p,q)', 1), ('EU(?,?)', 'EU(p,q)', 2), ('&(EU(?,?),true)', '&(EU(p,q),true)', 2)]:
+		for temporal_encoding in ['unroll', 'rank']:
+			learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators, template=template,\
+									temporal_encoding=temporal_encoding)
+			learned_formula = learn.learn_ctl()
+			assert learned_formula.prettyPrint() == CTLFormula.convertTextToFormula(formula).prettyPrint()
+			assert learn.metadata['Learned Formula Size'] == hole_size
+
+def test_multilabel_learning():
+
+	# sample_EU_swapped.sp is sample_EU.sp with the positive and negative structures swapped
+	sample_path = os.path.join(os.path.dirname(__file__), 'inputs', 'sample_EU.sp')
+	label_files = [os.path.join(os.path.dirname(__file__), 'inputs', name) for name in ['sample_EU_swapped.sp', 'sample_EF.sp']]
+	learn = LearnFramework(sample_file=sample_path, size_bound=4, operators=ctl_operators, label_files=label_files)
+	learned_formulas = learn.learn_labels()
+
+	assert learned_formulas[0].prettyPrint() == CTLFormula.convertTextToFormula('EU(p,q)').prettyPrint()
+	assert learned_formulas[2].prettyPrint() == CTLFormula.convertTextToFormula('EF(p)').prettyPrint()
+	assert [result['Learned Formula Size'] for result in learn.metadata['Labellings']] == [3, 4, 2]